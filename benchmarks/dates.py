@@ -0,0 +1,59 @@
+# encoding: utf-8
+
+"""
+Compares the fast path for Graph API timestamps in 
+`utils.date.parse` with dateutil, on the timestamps 
+found in posts and insights.
+
+    python benchmarks/dates.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from dateutil import parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from facebookinsights.utils import date
+
+
+def post_timestamps(n=10000):
+    start = datetime(2012, 1, 1, 13, 37, 12)
+    return [(start + timedelta(minutes=97 * i)).strftime('%Y-%m-%dT%H:%M:%S+0000') 
+        for i in range(n)]
+
+def insights_timestamps(n=10000):
+    start = datetime(2012, 1, 1, 7)
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%dT%H:%M:%S+0000') 
+        for i in range(n)]
+
+def validate(timestamps):
+    # other offsets should come out the same as well
+    timestamps = timestamps + [
+        '2014-08-19T07:00:00-0700', 
+        '2014-08-19T07:00:00+05:30', 
+        '2014-08-19', 
+        ]
+    for timestamp in timestamps:
+        assert date.parse(timestamp) == parser.parse(timestamp), timestamp
+
+def measure(name, timestamps, repeat=3):
+    dateutil = min(timeit.repeat(
+        lambda: [parser.parse(timestamp) for timestamp in timestamps], 
+        number=1, repeat=repeat))
+    fast = min(timeit.repeat(
+        lambda: [date.parse(timestamp) for timestamp in timestamps], 
+        number=1, repeat=repeat))
+    print("{:<10} {:>8} timestamps  dateutil {:.3f}s  fast path {:.3f}s  {:.1f}x".format(
+        name, len(timestamps), dateutil, fast, dateutil / fast))
+
+
+if __name__ == '__main__':
+    posts = post_timestamps()
+    insights = insights_timestamps()
+    validate(posts + insights)
+    measure('posts', posts)
+    measure('insights', insights)
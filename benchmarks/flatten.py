@@ -0,0 +1,69 @@
+# encoding: utf-8
+
+"""
+Compares `utils.flat.Flattener`, which compiles a key schema
+per metric once, with `utils.flatten`, on rows of breakdown
+metrics like the ones `serialize(flat=True)` produces.
+
+    python benchmarks/flatten.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from facebookinsights import utils
+from facebookinsights.graph import InsightsSelection
+
+from facebookinsights.tests import mockapi
+
+
+BREAKDOWNS = [
+    'page_impressions_by_country_unique',
+    'page_fans_gender_age',
+    ]
+
+
+def breakdown_rows(n=5000):
+    graph = mockapi.Graph()
+    rows = []
+    for day in range(n):
+        row = {'end_time': str(day), 'page_impressions': day}
+        for metric in BREAKDOWNS:
+            row[metric] = graph.value(metric, day)
+        # nested, but left alone
+        row['page_fans_online'] = dict((str(hour), day + hour) for hour in range(24))
+        # keys that only show up partway through a range
+        if day > n // 2:
+            row['page_impressions_by_country_unique']['ZZ'] = day
+        rows.append(row)
+    return rows
+
+def validate(rows):
+    skip = InsightsSelection.NESTED_METRICS
+    flatten = utils.flat.Flattener(skip=skip)
+    for row in rows:
+        assert flatten(row) == utils.flatten(row, skip=skip), row
+
+def measure(name, rows, repeat=3):
+    skip = InsightsSelection.NESTED_METRICS
+    recursive = min(timeit.repeat(
+        lambda: [utils.flatten(row, skip=skip) for row in rows],
+        number=1, repeat=repeat))
+
+    def compiled():
+        flatten = utils.flat.Flattener(skip=skip)
+        return [flatten(row) for row in rows]
+
+    fast = min(timeit.repeat(compiled, number=1, repeat=repeat))
+    print("{:<10} {:>8} rows  recursive {:.3f}s  compiled {:.3f}s  {:.1f}x".format(
+        name, len(rows), recursive, fast, recursive / fast))
+
+
+if __name__ == '__main__':
+    rows = breakdown_rows()
+    validate(rows)
+    measure('breakdowns', rows)
@@ -0,0 +1,232 @@
+# encoding: utf-8
+
+"""
+Benchmarks for `facebookinsights` against a local mock Graph API,
+so they need neither a token nor network access.
+
+    python benchmarks/run.py --latency 0.05 --posts 2000
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --compare before.json
+
+Each benchmark reports its best time out of `--repeat` runs, the
+throughput in items per second and, on Python 3, peak memory.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+from datetime import timedelta
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import facebookinsights as fi
+from facebookinsights.utils.api import GraphAPI
+from facebookinsights.tests import mockapi
+
+import dates
+
+
+BREAKDOWNS = [
+    'page_impressions_by_country_unique',
+    'page_fans_gender_age',
+    ]
+
+
+def measure(function, repeat):
+    """ Best time across runs and, in a separate run because 
+    tracing slows things down considerably, peak memory. """
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        items = function()
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+
+    if tracemalloc:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = None
+
+    return best, items, peak
+
+
+class Suite(object):
+    def __init__(self, server, options):
+        self.server = server
+        self.options = options
+        root = GraphAPI(url=server.url)
+        self.page = fi.graph.Page('token', root=root)
+
+    def posts(self):
+        since = self.server.graph.now - self.server.graph.interval * (self.options.posts - 1)
+        return len(self.page.posts.range(since, self.server.graph.now).get())
+
+    def posts_stream(self):
+        since = self.server.graph.now - self.server.graph.interval * (self.options.posts - 1)
+        return sum(1 for post in self.page.posts.range(since, self.server.graph.now).stream())
+
+    def posts_crawl(self):
+        since = self.server.graph.now - self.server.graph.interval * (self.options.posts - 1)
+        return len(self.page.posts.range(since, self.server.graph.now).crawl())
+
+    def _insights(self):
+        until = self.server.graph.now - timedelta(days=1)
+        return self.page.insights.daily(self.metrics()).range(until=until, days=self.options.days)
+
+    def metrics(self):
+        plain = ['page_metric_{}'.format(i) for i in range(self.options.metrics)]
+        return plain + BREAKDOWNS
+
+    def insights_rows(self):
+        rows = self._insights().get_rows()
+        return len(rows) * len(self.metrics())
+
+    def insights_serialize(self):
+        rows = self._insights().serialize(flat=True)
+        return len(rows) * len(self.metrics())
+
+    def flatten(self):
+        graph = self.server.graph
+        rows = [dict([('end_time', str(day))] +
+            [(metric, graph.value(metric, day)) for metric in BREAKDOWNS])
+            for day in range(self.options.days * 10)]
+        for row in rows:
+            fi.utils.flatten(row)
+        return len(rows)
+
+    def flatten_compiled(self):
+        graph = self.server.graph
+        rows = [dict([('end_time', str(day))] + 
+            [(metric, graph.value(metric, day)) for metric in BREAKDOWNS]) 
+            for day in range(self.options.days * 10)]
+        flatten = fi.utils.flat.Flattener()
+        for row in rows:
+            flatten(row)
+        return len(rows)
+
+    def extract(self):
+        posts = [fi.graph.Post(self.page, self.server.graph.post(i)) 
+            for i in range(self.options.posts * 10)]
+        fi.graph.extract(posts)
+        return len(posts)
+
+    def date_parse(self):
+        timestamps = dates.post_timestamps(self.options.posts * 10)
+        for timestamp in timestamps:
+            fi.utils.date.parse(timestamp)
+        return len(timestamps)
+
+    def batch_fanout(self):
+        posts = self.page.posts.latest(self.options.fanout)
+        results = posts.insights.lifetime(['post_impressions', 'post_consumptions']).get()
+        return len(results) * 2
+
+    BENCHMARKS = [
+        ('posts', 'posts'),
+        ('posts_stream', 'posts'),
+        ('posts_crawl', 'posts'),
+        ('insights_rows', 'values'),
+        ('insights_serialize', 'values'),
+        ('flatten', 'rows'),
+        ('flatten_compiled', 'rows'),
+        ('extract', 'posts'),
+        ('date_parse', 'timestamps'),
+        ('batch_fanout', 'values'),
+        ]
+
+    def run(self, only=None):
+        results = []
+        for name, unit in self.BENCHMARKS:
+            if only and name not in only:
+                continue
+            requests = self.server.requests
+            downloaded = self.server.bytes
+            seconds, items, peak = measure(getattr(self, name), self.options.repeat)
+            runs = self.options.repeat + (1 if tracemalloc else 0)
+            results.append({
+                'name': name,
+                'seconds': seconds,
+                'items': items,
+                'unit': unit,
+                'throughput': items / seconds if seconds else None,
+                'peak_memory': peak,
+                'requests': (self.server.requests - requests) // runs,
+                'bytes': (self.server.bytes - downloaded) // runs,
+                })
+        return results
+
+
+def report(results, baseline=None):
+    baseline = dict((result['name'], result) for result in (baseline or []))
+    for result in results:
+        line = "{name:<20} {seconds:>8.3f}s {throughput:>12,.0f} {unit}/s".format(**result)
+        if result['peak_memory'] is not None:
+            line += " {:>10,.0f} KiB".format(result['peak_memory'] / 1024.0)
+        line += " {:>5} requests".format(result['requests'])
+        previous = baseline.get(result['name'])
+        if previous:
+            line += "  {:.2f}x as fast as baseline".format(previous['seconds'] / result['seconds'])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='seconds of latency for every request to the mock server')
+    parser.add_argument('--page-size', type=int, default=25,
+        help='posts per page of results')
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--metrics', type=int, default=20,
+        help='amount of plain metrics, on top of a couple of breakdowns')
+    parser.add_argument('--fanout', type=int, default=200,
+        help='amount of posts to fetch lifetime insights for')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*',
+        help='only run these benchmarks')
+    parser.add_argument('--output',
+        help='save results as JSON, e.g. to compare against later')
+    parser.add_argument('--compare',
+        help='results from an earlier run to compare against')
+    options = parser.parse_args(argv)
+
+    with mockapi.Server(latency=options.latency, posts=options.posts,
+            page_size=options.page_size) as server:
+        results = Suite(server, options).run(options.only)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+    report(results, baseline)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'options': vars(options),
+                'results': results,
+                }, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
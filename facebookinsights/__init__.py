@@ -1,13 +1,16 @@
 # encoding: utf-8
 
 import os
+import functools
 from . import oauth
 from . import graph
+from . import sync
 from . import utils
 # import commands
 
 
-def authenticate(client_id=None, client_secret=None, tokens=[], token=None):
+def authenticate(client_id=None, client_secret=None, tokens=[], token=None, 
+        lazy=False, workers=utils.parallel.WORKERS, cache=None, hooks=[]):
     if not client_id:
         client_id = os.environ.get('FACEBOOK_INSIGHTS_CLIENT_ID')
     if not client_secret:
@@ -29,7 +32,14 @@ def authenticate(client_id=None, client_secret=None, tokens=[], token=None):
             FACEBOOK_INSIGHTS_CLIENT_SECRET.
             """))
 
+    # pages fetch their metadata concurrently, 
+    # or only when first needed if lazy
+    root = utils.api.GraphAPI(cache=cache, hooks=hooks, 
+        pool_size=max(workers, utils.api.POOL_SIZE))
+    Page = functools.partial(graph.Page, lazy=lazy, root=root)
     if token:
-        return graph.Page(token)
+        return Page(token)
+    elif lazy:
+        return [Page(token) for token in tokens]
     else:
-        return [graph.Page(token) for token in tokens]
+        return utils.parallel.map(Page, tokens, workers)
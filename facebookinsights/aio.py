@@ -0,0 +1,456 @@
+# encoding: utf-8
+
+"""
+An asyncio Graph API client, with pages and selections on top
+of it, so that a single event loop can drive many concurrent
+requests across many pages. Requires Python 3.6+ and aiohttp,
+and is therefore not imported along with `facebookinsights`.
+
+    from facebookinsights import aio
+
+    async def main(tokens):
+        async with aio.GraphAPI() as root:
+            pages = [aio.Page(token, root=root) for token in tokens]
+            await asyncio.gather(*[page.load() for page in pages])
+            ...
+"""
+
+import asyncio
+import copy
+import functools
+import itertools
+import json
+from decimal import Decimal
+
+import aiohttp
+import facepy
+
+from . import graph
+from . import utils
+from .utils.api import BATCH_SIZE
+
+
+# the maximum amount of open connections
+# shared between all clients derived from a root
+POOL_SIZE = 100
+# options meant for the blocking client
+# that don't belong in the querystring
+FACEPY_OPTIONS = ['page', 'retry']
+
+
+def _querystring(options):
+    qs = {}
+    for key, value in options.items():
+        if key in FACEPY_OPTIONS:
+            continue
+        elif isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, set, tuple)):
+            value = ",".join(value)
+        elif isinstance(value, dict):
+            value = json.dumps(value)
+        qs[key] = str(value)
+    return qs
+
+def _raise_for_error(data):
+    # mirrors how facepy reports errors
+    if isinstance(data, dict):
+        if 'error' in data:
+            error = data['error']
+            if error.get('type') == 'OAuthException':
+                exception = facepy.OAuthError
+            else:
+                exception = facepy.FacebookError
+        elif 'error_msg' in data:
+            error = data
+            exception = facepy.FacebookError
+        else:
+            return
+        raise exception(
+            message=error.get('message', error.get('error_msg')),
+            code=error.get('code'),
+            error_subcode=error.get('error_subcode'),
+            is_transient=error.get('is_transient'),
+            fbtrace_id=error.get('fbtrace_id'),
+            )
+
+def parse(body):
+    try:
+        data = json.loads(body, parse_float=Decimal)
+    except ValueError:
+        return body
+    _raise_for_error(data)
+    return data
+
+
+class GraphAPI(utils.api.Endpoints):
+    """ A Graph API client with the same `partial`, `get`
+    and `all` as the blocking client, but as coroutines.
+    All clients derived from one root through `partial`
+    share a single pooled HTTP session. """
+
+    def __init__(self, oauth_token=False, url='https://graph.facebook.com',
+            version=None, pool_size=POOL_SIZE, workers=utils.parallel.WORKERS,
+            timeout=None, scheduler=None, hooks=()):
+        self.oauth_token = oauth_token
+        self.url = url.strip('/')
+        self.version = version
+        self.pool_size = pool_size
+        self.workers = workers
+        self.timeout = timeout
+        self.scheduler = scheduler or utils.ratelimit.Scheduler()
+        self.hooks = list(hooks)
+        self.base = []
+        # shared by reference with every partial client
+        self._shared = {'session': None}
+
+    @property
+    def session(self):
+        # sessions can only be created with a running event loop
+        if self._shared['session'] is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._shared['session'] = aiohttp.ClientSession(
+                connector=connector, timeout=timeout)
+        return self._shared['session']
+
+    async def close(self):
+        if self._shared['session'] is not None:
+            await self._shared['session'].close()
+            self._shared['session'] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def with_token(self, oauth_token):
+        """ A root client for a different token that
+        shares this client's connection pool. """
+        client = copy.copy(self)
+        client.oauth_token = oauth_token
+        client.base = []
+        return client
+
+    def partial(self, base):
+        client = copy.copy(self)
+        client.base = self.base + self._segmentize_endpoint(base)
+        return client
+
+    def subscribe(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def unsubscribe(self, hook):
+        self.hooks.remove(hook)
+
+    def _get_url(self, path):
+        if path.startswith('http'):
+            return path
+        elif self.version:
+            return '{}/v{}/{}'.format(self.url, self.version, path)
+        else:
+            return '{}/{}'.format(self.url, path)
+
+    async def _query(self, method, path, options={}):
+        url = self._get_url(path)
+        options = _querystring(options)
+        # urls for the next page of results include a token
+        if self.oauth_token and url != path:
+            options['access_token'] = self.oauth_token
+
+        # paced and retried just like the blocking client
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.scheduler.reserve(self.oauth_token or None))
+            start = utils.instrument.timer()
+            try:
+                if method == 'GET':
+                    request = self.session.get(url, params=options)
+                else:
+                    request = self.session.request(method, url, data=options)
+                async with request as response:
+                    body = await response.text()
+                    status = response.status
+                    self.scheduler.update(response.headers, self.oauth_token or None)
+            except aiohttp.ClientError as exception:
+                raise facepy.HTTPError(exception)
+
+            seconds = utils.instrument.timer() - start
+            throttled = utils.ratelimit.is_throttled(status, body)
+            if attempt < self.scheduler.retries and throttled:
+                self.scheduler.throttled(attempt)
+                attempt += 1
+            else:
+                utils.instrument.emit(self.hooks, 'request', 
+                    method=method, 
+                    endpoint=utils.instrument.endpoint(url), 
+                    status=status, 
+                    bytes=len(body.encode('utf-8')), 
+                    seconds=seconds, 
+                    retries=attempt)
+                return parse(body)
+
+    async def get(self, relative_endpoint=[], **options):
+        """ An endpoint can be specified as a string
+        or as a list of path segments. """
+        endpoint = self._resolve_endpoint(relative_endpoint)
+        return await self._query('GET', endpoint, options)
+
+    async def paginate(self, relative_endpoint=[], **options):
+        """ Yields each page of results. """
+        url = self._resolve_endpoint(relative_endpoint)
+        while url:
+            page = await self._query('GET', url, options)
+            yield page
+            url = page.get('paging', {}).get('next')
+            # the next url already contains all options
+            options = {}
+
+    async def batch(self, requests):
+        """ Returns responses for each request or, for failed
+        requests, the exception instead. """
+        responses = await self._query('POST', '',
+            {'batch': json.dumps(requests)})
+
+        results = []
+        for response in responses:
+            if not response:
+                results.append(None)
+                continue
+            try:
+                results.append(parse(response['body']))
+            except facepy.FacepyError as exception:
+                results.append(exception)
+        return results
+
+    async def all(self, endpoint, paramsets, method='GET', body=False, **options):
+        """ Like `utils.api.GraphAPI.all`, with no more than
+        `workers` batch requests in flight at any one time. """
+        requests = self._batch_requests(endpoint, paramsets, method, body, options)
+        batches = [requests[i:i + BATCH_SIZE]
+            for i in range(0, len(requests), BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def send(batch):
+            async with semaphore:
+                responses = await self.batch(batch)
+                # retry throttled sub-requests, not the entire batch
+                for attempt in range(self.scheduler.retries):
+                    throttled = [i for i, response in enumerate(responses)
+                        if utils.ratelimit.is_throttled_error(response)]
+                    if not throttled:
+                        break
+                    self.scheduler.throttled(attempt)
+                    retried = await self.batch([batch[i] for i in throttled])
+                    for i, response in zip(throttled, retried):
+                        responses[i] = response
+                return responses
+
+        responses = await asyncio.gather(*[send(batch) for batch in batches])
+        return list(itertools.chain(*responses))
+
+
+class Awaitable(object):
+    """ Selections that can only be awaited: iterating over
+    or indexing into them would block the event loop. """
+
+    def _blocking(self, *vargs):
+        raise TypeError("Asynchronous selections can't be iterated over "
+            "or indexed into, use `await selection.get()` instead.")
+
+    __iter__ = __getitem__ = _blocking
+
+
+class InsightsSelection(Awaitable, graph.InsightsSelection):
+    async def get_raw(self):
+        if self.is_batched:
+            return await self.graph.all('insights',
+                self._paramsets(), **self.params)
+        else:
+            return [await self.graph.get('insights',
+                **self.params)]
+
+    async def get_datasets(self):
+        return self._datasets(await self.get_raw())
+
+    async def get_rows(self, compact=False):
+        start = utils.instrument.timer()
+        datasets = await self.get_datasets()
+        fetched = utils.instrument.timer()
+        rows = utils.rows.build(datasets, compact=compact)
+        utils.instrument.emit(self.graph.hooks, 'select',
+            selection='insights',
+            items=len(rows),
+            fetch=fetched - start,
+            parse=utils.instrument.timer() - fetched)
+        return rows
+
+    async def to_arrays(self):
+        return utils.columnar.arrays(await self.get_datasets())
+
+    async def to_frame(self):
+        return utils.columnar.frame(await self.get_datasets())
+
+    async def get(self):
+        return self._simplify(await self.get_rows())
+
+    async def serialize(self, flat=False, timestamp=False):
+        return self._serialize(await self.get_rows(), flat, timestamp)
+
+    async def export(self, sink, flat=False, timestamp=False):
+        rows = await self.get_rows(compact=True)
+        sink.begin(self.columns(rows, flat))
+        for row in self._serialized(rows, flat, timestamp):
+            sink.write(row)
+        return len(rows)
+
+
+class PostInsightsSelection(Awaitable, graph.PostInsightsSelection):
+    async def get_raw(self):
+        posts = await self.edge.get()
+        paramsets = self._paramsets(posts)
+        responses = await self.graph.all('insights', paramsets, **self.params)
+        return self._group(posts, paramsets, responses)
+
+    async def get_datasets(self):
+        return self._datasets(await self.get_raw())
+
+    async def get_rows(self, compact=False):
+        start = utils.instrument.timer()
+        posts = await self.get_datasets()
+        fetched = utils.instrument.timer()
+        rows = self._each(posts, utils.rows.build, compact)
+        utils.instrument.emit(self.graph.hooks, 'select',
+            selection='post insights',
+            items=sum(len(post) for post in self._succeeded(rows)),
+            fetch=fetched - start,
+            parse=utils.instrument.timer() - fetched)
+        return rows
+
+    async def get(self):
+        return self._each(await self.get_rows(), self._simplify)
+
+    async def to_arrays(self):
+        return self._each(await self.get_datasets(), utils.columnar.arrays)
+
+    async def to_frame(self):
+        return self._each(await self.get_datasets(), utils.columnar.frame)
+
+    async def serialize(self, flat=False, timestamp=False):
+        return self._each(await self.get_rows(), self._serialize, flat, timestamp)
+
+    async def export(self, sink, flat=False, timestamp=False):
+        posts = await self.get_rows(compact=True)
+        return super(PostInsightsSelection, self).export(sink, flat, timestamp, rows=posts)
+
+
+class PostSelection(Awaitable, graph.PostSelection):
+    async def stream(self):
+        """ Yields posts as each page of results comes in. """
+        if self.params['page']:
+            pages = self.graph.paginate('posts', **self.params)
+        else:
+            pages = _once(self.graph.get('posts', **self.params))
+
+        since = self.meta['since']
+        after = self.meta.get('after')
+        # only time spent waiting on the Graph API counts as fetching
+        fetch = 0
+        items = 0
+        try:
+            while True:
+                start = utils.instrument.timer()
+                try:
+                    page = await pages.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    fetch += utils.instrument.timer() - start
+                for post in page['data']:
+                    post = Post(self.edge, post)
+                    created_time = post.created_time
+                    if created_time.date() >= since and (after is None or created_time >= after):
+                        items += 1
+                        yield post
+                    else:
+                        return
+        finally:
+            utils.instrument.emit(self.graph.hooks, 'select',
+                selection='posts',
+                items=items,
+                fetch=fetch)
+
+    async def get(self):
+        return [post async for post in self.stream()]
+
+    async def crawl(self, windows=None):
+        selections = self._windows(windows or self.graph.workers)
+        return self._merge(await asyncio.gather(
+            *[selection.get() for selection in selections]))
+
+    async def resolve_links(self, clean=False, **options):
+        """ Links are resolved in a thread pool, so as
+        not to block the event loop while they are. """
+        posts = await self.get()
+        resolve = functools.partial(graph.resolve_links, posts, clean, **options)
+        return await asyncio.get_event_loop().run_in_executor(None, resolve)
+
+    async def extract(self):
+        return graph.extract(await self.get())
+
+    @property
+    def insights(self):
+        return PostInsightsSelection(self)
+
+
+async def _once(coroutine):
+    yield await coroutine
+
+
+class Post(graph.Post):
+    __slots__ = ()
+
+    @property
+    def insights(self):
+        return InsightsSelection(self)
+
+
+class Page(graph.Page):
+    """ A page whose metadata is only available after
+    `await page.load()`. Pass in a `root` client to share
+    its connection pool between many pages. """
+
+    def __init__(self, token, root=None):
+        if root is None:
+            root = GraphAPI(token)
+        else:
+            root = root.with_token(token)
+        self.graph = root.partial('me')
+        self._raw = None
+
+    async def load(self):
+        self._raw = await self.graph.get()
+        return self
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            raise ValueError("Page metadata is not available until `await page.load()`.")
+        return self._raw
+
+    async def metrics(self, period=None):
+        """ Like `graph.Page.metrics`, but not memoized, 
+        as a coroutine can only be awaited once. """
+        options = {'period': period} if period else {}
+        datasets = (await self.graph.get('insights', **options))['data']
+        return sorted(set(dataset['name'] for dataset in datasets))
+
+    @property
+    def insights(self):
+        return InsightsSelection(self)
+
+    @property
+    def posts(self):
+        return PostSelection(self)
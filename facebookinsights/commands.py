@@ -1,49 +1,253 @@
 # encoding: utf-8
 
+"""
+    insights authorize --client-id ID --client-secret SECRET
+    insights ls
+    insights page --metrics page_impressions,page_fan_adds --days 7 --format csv
+    insights posts "Guardian US" --since 2014-05-01 --days 5 --output posts.ndjson.gz
+"""
+
+import json
 import click
+import keyring
+from keyring.errors import KeyringError
+
+from . import graph
+from . import oauth
+from . import utils
+
+
+# page tokens are kept in the system keyring,
+# as a single JSON object of tokens by page name
+KEYRING_SERVICE = 'facebook-insights'
+KEYRING_USERNAME = 'pages'
+
+PERIODS = {
+    'day': 'daily',
+    'week': 'weekly',
+    'days_28': 'monthly',
+    'lifetime': 'lifetime',
+    }
+
+SINKS = {
+    'ndjson': utils.export.NDJSON,
+    'csv': utils.export.CSV,
+    }
+
+
+def load_pages():
+    try:
+        pages = keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
+    except KeyringError as error:
+        raise click.ClickException("Could not read stored pages: {}".format(error))
+    return json.loads(pages or '{}')
+
+def save_pages(pages):
+    keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, json.dumps(pages))
+
+def select_pages(names, tokens):
+    """ (name, token) pairs for the stored pages in `names`, or
+    for every stored page if none are named and no `tokens`
+    were passed in directly either. We don't know the names
+    that go with those tokens yet. """
+    if names or not tokens:
+        stored = load_pages()
+    else:
+        stored = {}
+    unknown = [name for name in names if name not in stored]
+    if unknown:
+        raise click.UsageError("Unknown pages: {}. Use `insights ls` to list them.".format(
+            ", ".join(unknown)))
+    selected = [(name, stored[name]) for name in (names or sorted(stored))]
+    return selected + [(None, token) for token in tokens]
+
+def count(rows):
+    # post insights are tables by post id, 
+    # or errors for posts without insights
+    if isinstance(rows, dict):
+        return sum(len(table) for table in rows.values() 
+            if not isinstance(table, Exception))
+    else:
+        return len(rows)
+
+def with_metrics(period, options):
+    if options['metrics']:
+        return period(options['metrics'].split(','))
+    else:
+        return period()
+
+def check_range(options):
+    # a range ends today unless told otherwise, 
+    # but there's no telling when it should start
+    if options['until'] and not (options['since'] or options['months'] or options['days']):
+        raise click.UsageError("--until requires --since, --months or --days.")
+
+def in_range(selection, options):
+    if options['since'] or options['until'] or options['months'] or options['days']:
+        return selection.range(options['since'], options['until'],
+            months=options['months'], days=options['days'])
+    else:
+        return selection
+
+
+def export(pages, query, options):
+    """ Fetch insights for many pages in a pool of workers and
+    write them to a single sink as each page comes in. """
+    stats = utils.instrument.Stats()
+    root = utils.api.GraphAPI(url=options['graph_url'], hooks=[stats],
+        pool_size=max(options['workers'], utils.api.POOL_SIZE))
+
+    def fetch(page):
+        name, token = page
+        try:
+            page = graph.Page(token, lazy=True, root=root)
+            name = name or page.name
+            selection = query(page)
+            return name, selection, selection.get_rows(compact=True), None
+        except Exception as error:
+            return name or 'token ' + token[:8], None, None, error
+
+    def progress(message):
+        if not options['quiet']:
+            click.echo(message, err=True)
+
+    flat = options['flat']
+    timestamp = options['timestamp']
+    # columns depend on the data for every page, flattened or not, 
+    # so for csv, which has a single header, we can only write 
+    # once we have every page
+    buffered = options['format'] == 'csv' and len(pages) > 1
+    pending = []
+    failures = 0
+
+    Sink = SINKS[options['format']]
+    with Sink(options['output']) as sink:
+        results = utils.parallel.as_completed(fetch, pages, options['workers'])
+        for i, (name, selection, rows, error) in enumerate(results, 1):
+            if error:
+                failures += 1
+                progress(u"[{}/{}] {}: failed ({})".format(i, len(pages), name, error))
+                continue
+
+            progress(u"[{}/{}] {}: {} rows".format(i, len(pages), name, count(rows)))
+            if buffered:
+                pending.append((name, selection, rows))
+            else:
+                selection.export(utils.export.Tagged(sink, page=name), flat, timestamp, rows)
+
+        if pending:
+            fields = []
+            for name, selection, rows in pending:
+                for field in selection.columns(rows, flat):
+                    if field not in fields:
+                        fields.append(field)
+            sink.begin(['page'] + fields)
+            for name, selection, rows in pending:
+                selection.export(utils.export.Tagged(sink, page=name), flat, timestamp, rows)
+
+    progress(u"{} requests, {} bytes, {} retries".format(
+        stats.requests, stats.bytes, stats.retries))
+
+    if failures:
+        raise click.ClickException("Failed to export {} out of {} pages.".format(
+            failures, len(pages)))
+
+
+def export_options(command):
+    options = [
+        click.argument('names', nargs=-1),
+        click.option('-t', '--token', 'tokens', multiple=True,
+            help='a page token, to export pages that were not stored with `authorize`'),
+        click.option('-s', '--since'),
+        click.option('-u', '--until'),
+        click.option('-m', '--months', default=0),
+        click.option('-d', '--days', default=0),
+        click.option('-M', '--metrics',
+            help='a comma-separated list of metrics'),
+        click.option('-f', '--format', type=click.Choice(sorted(SINKS)), default='ndjson',
+            help='csv has a single header for all pages, so when exporting more than '
+                 'one page, every page is kept in memory until all of them are in'),
+        click.option('-o', '--output', default='-',
+            help='a file to write to, compressed if it ends in .gz, or - for stdout'),
+        click.option('--flat', is_flag=True,
+            help='flatten breakdown metrics into a column for each key'),
+        click.option('--timestamp', is_flag=True,
+            help='end times as unix timestamps'),
+        click.option('-w', '--workers', default=utils.parallel.WORKERS,
+            help='how many pages to fetch at the same time'),
+        click.option('-q', '--quiet', is_flag=True,
+            help='do not report progress'),
+        click.option('--graph-url', default='https://graph.facebook.com', hidden=True,
+            help='where to find the Graph API, e.g. a mock to test against'),
+        ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
 
 @click.group()
-@click.option('--client-id', 
-    help='the app id to your facebook app', 
+@click.option('--client-id',
+    help='the app id to your facebook app',
     envvar='FACEBOOK_INSIGHTS_CLIENT_ID')
-@click.option('--client-secret', 
-    help='the client secret to your facebook app', 
+@click.option('--client-secret',
+    help='the client secret to your facebook app',
     envvar='FACEBOOK_INSIGHTS_CLIENT_SECRET')
-@click.argument('page') # help='the name of the Facebook Page you would like to fetch insights from'
-def cli(page=None):
-    # TODO: if no page is specified, list all pages that we've saved
-    pass
+@click.pass_context
+def cli(context, client_id, client_secret):
+    context.obj = {
+        'client_id': client_id,
+        'client_secret': client_secret,
+        }
 
 @cli.command()
-@click.option('--force', help='ignore any existing credentials')
-def authorize():
-    pass
+@click.option('--force', is_flag=True, help='forget any pages stored earlier')
+@click.pass_obj
+def authorize(credentials, force):
+    """ Store tokens for every page you manage. """
+    if not (credentials['client_id'] and credentials['client_secret']):
+        raise click.UsageError("Authorization requires a client id and client secret.")
+
+    tokens = oauth.authorize(credentials['client_id'], credentials['client_secret'])
+    root = utils.api.GraphAPI()
+    pages = utils.parallel.map(lambda token: graph.Page(token, root=root), tokens)
+
+    stored = {} if force else load_pages()
+    for page in pages:
+        stored[page.name] = page.token
+        click.echo(page.name)
+    save_pages(stored)
 
 @cli.command()
 def ls():
-    pass
+    """ List stored pages. """
+    for name in sorted(load_pages()):
+        click.echo(name)
 
 @cli.command()
-@cli.option('-s', '--since')
-@cli.option('-u', '--until')
-@cli.option('-m', '--months', default=0)
-@cli.option('-d', '--days', default=0)
-@cli.option('-p', '--period')
-@cli.option('-M', '--metrics')
-def page():
-    pass
+@export_options
+@click.option('-p', '--period', type=click.Choice(sorted(PERIODS)), default='day')
+def page(names, tokens, period, **options):
+    """ Export page insights for one or more pages,
+    or for every stored page. """
+    def query(page):
+        return in_range(with_metrics(getattr(page.insights, PERIODS[period]), options), options)
+
+    check_range(options)
+    export(select_pages(names, tokens), query, options)
 
 @cli.command()
-@cli.option('--since')
-@cli.option('--until')
-@cli.option('--months', default=0)
-@cli.option('--days', default=0)
-@cli.option('--metrics')
-def posts():
-    # a period doesn't make sense for posts, as all post metrics 
-    # are lifetime metrics
-    pass
+@export_options
+def posts(names, tokens, **options):
+    """ Export insights for the posts of one or more pages,
+    or of every stored page. """
+    # a period doesn't make sense for posts, as all
+    # post metrics are lifetime metrics
+    def query(page):
+        return with_metrics(in_range(page.posts, options).insights.lifetime, options)
 
-"""
-insights posts Guardian\ US --metrics page_impressions --since 2014-05-01 --days 5
-"""
\ No newline at end of file
+    check_range(options)
+    export(select_pages(names, tokens), query, options)
+
+
+def main():
+    cli()
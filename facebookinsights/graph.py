@@ -5,12 +5,13 @@ import re
 import math
 import copy
 import functools
-from collections import namedtuple
+import itertools
+from collections import OrderedDict
 import pytz
 from datetime import datetime, timedelta
 from . import utils
 from .utils.api import GraphAPI
-from .utils.functional import immutable, memoize
+from .utils.functional import immutable, lazy, memoize
 
 
 class Selection(object):
@@ -69,29 +70,120 @@ class PostSelection(Selection):
         self.params['limit'] = n
         return self
 
+    # we can't do without these, e.g. to know 
+    # when we've reached the end of a date range
+    REQUIRED_FIELDS = ['id', 'created_time']
+
+    @immutable
+    def fields(self, *names, **expansions):
+        """ Only fetch the fields you need, e.g. 
+        `fields('link', comments={'limit': 0, 'summary': True})` 
+        or the equivalent `fields('link', 'comments.limit(0).summary(true)')`. """
+        fields = list(self.REQUIRED_FIELDS)
+        for name in names:
+            if name not in fields:
+                fields.append(name)
+        for name, modifiers in sorted(expansions.items()):
+            fields.append(name + "".join(
+                ".{}({})".format(key, utils.api.serialize(value)) 
+                for key, value in sorted(modifiers.items())))
+        self.params['fields'] = ",".join(fields)
+        return self
+
     def find(self, q):
         return self.graph.find(q, 'post')
 
-    def get(self):
+    def resolve_links(self, clean=False, **options):
+        return resolve_links(self, clean, **options)
+
+    def extract(self):
+        return extract(self)
+
+    @property
+    def insights(self):
+        return PostInsightsSelection(self)
+
+    def stream(self, prefetch=True):
+        """ Yield posts as each page of results comes in, 
+        rather than waiting for all of them. With `prefetch`, 
+        the next page is fetched in the background while 
+        the current one is being processed. """
+        start = utils.instrument.timer()
         pages = self.graph.get('posts', **self.params)
         if not self.params['page']:
             pages = [pages]
+        elif prefetch:
+            pages = utils.parallel.prefetch(pages)
+
+        since = self.meta['since']
+        after = self.meta.get('after')
+        clock = {'seconds': utils.instrument.timer() - start, 'items': 0}
+        try:
+            for page in utils.instrument.timed(pages, clock):
+                for post in page['data']:
+                    post = Post(self.edge, post)
+
+                    # For date ranges, we can't rely on pagination 
+                    # because `since` and `until` parameters serve 
+                    # both as paginators and as range delimiters, 
+                    # so there will always be a next page.
+                    created_time = post.created_time
+                    if created_time.date() >= since and (after is None or created_time >= after):
+                        clock['items'] += 1
+                        yield post
+                    else:
+                        return
+        finally:
+            utils.instrument.emit(self.graph.hooks, 'select', 
+                selection='posts', 
+                items=clock['items'], 
+                fetch=clock['seconds'])
 
-        posts = []
-        for page in pages:
-            for post in page['data']:
-                post = Post(self.edge, post)
-
-                # For date ranges, we can't rely on pagination 
-                # because `since` and `until` parameters serve 
-                # both as paginators and as range delimiters, 
-                # so there will always be a next page.
-                if post.created_time.date() >= self.meta['since']:
-                    posts.append(post)
-                else:
-                    return posts
-
-        return posts
+    def get(self):
+        return list(self.stream(prefetch=False))
+
+    def _windows(self, n):
+        # windows split up the exact timestamps that `get` would 
+        # ask for, so that both cover the same range whatever 
+        # the local timezone is
+        if 'since' not in self.params:
+            raise ValueError("Crawling posts requires a date range.")
+        since = self.params['since']
+        until = self.params['until']
+        step = max((until - since) // n, 1)
+
+        selections = []
+        end = until
+        while end > since:
+            start = max(since, end - step)
+            selection = self.clone()
+            selection.params['since'] = start
+            selection.params['until'] = end
+            # the last window ends where `get` would
+            if start > since:
+                selection.meta['after'] = datetime.fromtimestamp(start, pytz.utc)
+            selections.append(selection)
+            end = start
+        return selections
+
+    def _merge(self, windows):
+        # windows that share an edge can both return 
+        # the posts right on that edge
+        posts = {}
+        for post in itertools.chain(*windows):
+            posts.setdefault(post.id, post)
+        return sorted(posts.values(), key=lambda post: post.created_time, reverse=True)
+
+    def crawl(self, windows=None, workers=None):
+        """ Like `get`, but splits the date range into time 
+        windows and paginates through each of them concurrently 
+        rather than through the entire range one page at a time, 
+        which for years worth of posts is a lot faster. Posts are 
+        returned newest first, without duplicates. """
+        workers = workers or self.graph.workers
+        selections = self._windows(windows or workers)
+        results = utils.parallel.map(lambda selection: selection.get(), selections, workers)
+        return self._merge(results)
 
 
 class InsightsSelection(Selection):
@@ -134,78 +226,116 @@ class InsightsSelection(Selection):
         # by default, Facebook returns three days 
         # worth' of insights data
         if self.has_daterange:
-            seconds = (self.meta['until'] - self.meta['since']).total_seconds()
+            # ranges include their last day, and so do 
+            # the requests for them (see `range`)
+            until = self.meta['until'] + timedelta(days=1)
+            seconds = (until - self.meta['since']).total_seconds()
             return math.ceil(seconds / 60 / 60 / 24)
         else:
             return 3        
 
+    # Facebook will not return more than three months 
+    # worth of insights data in a single request
+    MAX_DAYS = 31 * 3
+
     @property
     def is_valid(self):
         # TODO: investigate whether this applies too when asking for 
         # weekly or monthly metrics (that is, whether the limit is 93
         # result rows or truly 93 days)
-        if self.days <= 31 * 3:
+        if self.days <= self.MAX_DAYS:
             return True
         else:
             return False
 
-    def _get_row_date(self, row):
-        end_time = row.get('end_time')
+    @property
+    def chunks(self):
+        """ Split up the date range into subranges that are 
+        small enough for Facebook to accept. """
+        since = self.meta['since']
+        until = self.meta['until']
+        size = timedelta(days=self.MAX_DAYS - 1)
+        one_day = timedelta(days=1)
+
+        chunks = []
+        while since <= until:
+            stop = min(since + size, until)
+            chunks.append({
+                'since': utils.date.timestamp(since, utc=True), 
+                'until': utils.date.timestamp(stop + one_day, utc=True), 
+                })
+            since = stop + one_day
+
+        return chunks
 
-        if end_time:
-            end_time = utils.date.parse(end_time)
+    @property
+    def is_batched(self):
+        # multiple metrics and (for large date ranges) multiple 
+        # subranges are requested together in one or more batches
+        return 'metrics' in self.meta or not self.is_valid
+
+    def _paramsets(self, objects=[]):
+        metrics = [{'relative_url': metric} 
+            for metric in self.meta.get('metrics', [])]
+        if self.is_valid:
+            chunks = []
         else:
-            end_time = 'lifetime'  
-
-        return end_time
+            chunks = self.chunks
+        return utils.api.cross(objects, metrics, chunks)
 
     def get_raw(self):
-        if 'metrics' in self.meta:
-            metrics = [{'relative_url': metric} for metric in self.meta['metrics']]
+        if self.is_batched:
             results = self.graph.all('insights', 
-                metrics, **self.params)
+                self._paramsets(), **self.params)
         else:
-            results = [self.graph.get('insights', 
-                **self.params)]
+            # date ranges turn on pagination for posts, but 
+            # insights for a range come in a single response
+            params = dict(self.params, page=False)
+            results = [self.graph.get('insights', **params)]
 
         return results
 
-    def get_rows(self):
-        # TODO: for large date ranges, chunk them up and request
-        # the subranges in a batch request (this is a little bit
-        # more complex because multiple metrics are *also* batched
-        # and so these two things have to work together)
-        if not self.is_valid:
-            raise NotImplementedError(
-                "Can only fetch date ranges smaller than 3 months.")
-
-        results = self.get_raw()
+    def _datasets(self, results):
         datasets = []
         for result in results:
+            # failed requests in a batch are returned 
+            # as exceptions rather than raised
+            if isinstance(result, Exception):
+                raise result
             datasets.extend(result['data'])
 
-        metrics = set()
-        for dataset in datasets:
-            metric = dataset['name']
-            metrics.add(metric)
-
-        data = {}
-        for dataset in datasets:
-            metric = dataset['name']
-            rows = dataset['values']            
-            for row in rows:
-                date = self._get_row_date(row)
-                value = row['value']
-                record = utils.record(metrics)
-                period = data.setdefault(date, record)
-                period[metric] = value
-
-        fields = set(['end_time']).union(metrics)
-        Row = namedtuple('Row', fields)
-        return [Row(end_time=time, **values) for time, values in data.items()]
+        return datasets
+
+    def get_datasets(self):
+        return self._datasets(self.get_raw())
+
+    def get_rows(self, compact=False):
+        """ Rows ordered by end time, with a value for each 
+        metric. A compact `utils.rows.Table` is more economical 
+        for very large result sets. """
+        start = utils.instrument.timer()
+        datasets = self.get_datasets()
+        fetched = utils.instrument.timer()
+        rows = utils.rows.build(datasets, compact=compact)
+        utils.instrument.emit(self.graph.hooks, 'select', 
+            selection='insights', 
+            items=len(rows), 
+            fetch=fetched - start, 
+            parse=utils.instrument.timer() - fetched)
+        return rows
+
+    def to_arrays(self):
+        """ NumPy arrays by metric, plus an `end_time` index. """
+        return utils.columnar.arrays(self.get_datasets())
+
+    def to_frame(self):
+        """ A pandas DataFrame with a column for each metric. """
+        return utils.columnar.frame(self.get_datasets())
 
     def get(self):
-        results = self.get_rows()
+        return self._simplify(self.get_rows())
+
+    def _simplify(self, results):
         # when a single metric is requested (and not 
         # wrapped in a list), we return a simplified 
         # data format
@@ -216,21 +346,45 @@ class InsightsSelection(Selection):
         # when a lifetime metric is requested, 
         # we can simplify further
         if self.params.get('period') == 'lifetime':
-            results = results[0]
+            results = results[0] if results else None
 
         return results
 
     NESTED_METRICS = (
-        'page_fans_online'
+        'page_fans_online', 
     )
 
     def serialize(self, flat=False, timestamp=False):
-        _rows = []
-        for row in self.get():
+        return self._serialize(self.get_rows(), flat, timestamp)
+
+    def export(self, sink, flat=False, timestamp=False, rows=None):
+        """ Write serialized rows to a sink from `utils.export` 
+        one at a time, rather than building them all up in 
+        memory like `serialize` does. Rows that were already 
+        fetched with `get_rows(compact=True)` can be passed in. """
+        if rows is None:
+            rows = self.get_rows(compact=True)
+        sink.begin(self.columns(rows, flat))
+        for row in self._serialized(rows, flat, timestamp):
+            sink.write(row)
+        return len(rows)
+
+    def columns(self, rows, flat=False):
+        """ Columns for exported `rows`. """
+        return utils.export.schema([rows], flat, self.NESTED_METRICS)
+
+    def _serialize(self, rows, flat=False, timestamp=False):
+        return list(self._serialized(rows, flat, timestamp))
+
+    def _serialized(self, rows, flat=False, timestamp=False):
+        # rows share their keys, so key schemas 
+        # are compiled once for all of them
+        flatten = utils.flat.Flattener(skip=self.NESTED_METRICS)
+        for row in rows:
             _row = row._asdict()
 
             if flat:
-                _row = utils.flatten(_row, skip=self.NESTED_METRICS)
+                _row = flatten(_row)
 
             if timestamp:
                 end_time = utils.date.timestamp(_row['end_time'])
@@ -238,9 +392,7 @@ class InsightsSelection(Selection):
                 end_time = str(_row['end_time'])
 
             _row['end_time'] = end_time
-            _rows.append(_row)
-
-        return _rows
+            yield _row
 
     def __repr__(self):
         if 'metrics' in self.meta:
@@ -260,6 +412,102 @@ class InsightsSelection(Selection):
             repr(self.edge.name), metrics, date)
         
 
+class PostInsightsSelection(InsightsSelection):
+    """ Insights for every post in a post selection, fetched 
+    in as few batch requests as possible rather than post 
+    by post. Results are dictionaries keyed by post id. Posts 
+    that Facebook has no insights for, or that failed for any 
+    other reason, don't sink the entire selection: their 
+    results are the error instead. """
+
+    def _paramsets(self, posts):
+        # lifetime insights for older posts can be cached for longer
+        objects = [{'object': post.id, 'created': post.created_time} for post in posts]
+        return super(PostInsightsSelection, self)._paramsets(objects)
+
+    def _group(self, posts, paramsets, responses):
+        results = OrderedDict((post.id, []) for post in posts)
+        for paramset, response in zip(paramsets, responses):
+            results[paramset['object']].append(response)
+        return results
+
+    def get_raw(self):
+        posts = self.edge.get()
+        paramsets = self._paramsets(posts)
+        responses = self.graph.all('insights', paramsets, **self.params)
+        return self._group(posts, paramsets, responses)
+
+    def _each(self, posts, function, *vargs):
+        # errors are passed on as they are
+        return OrderedDict((id, results if isinstance(results, Exception) 
+                else function(results, *vargs)) 
+            for id, results in posts.items())
+
+    def _succeeded(self, posts):
+        return [results for results in posts.values() 
+            if not isinstance(results, Exception)]
+
+    def _datasets(self, raw):
+        _datasets = super(PostInsightsSelection, self)._datasets
+        posts = OrderedDict()
+        for id, results in raw.items():
+            errors = [result for result in results if isinstance(result, Exception)]
+            posts[id] = errors[0] if errors else _datasets(results)
+        return posts
+
+    def get_rows(self, compact=False):
+        start = utils.instrument.timer()
+        posts = self.get_datasets()
+        fetched = utils.instrument.timer()
+        rows = self._each(posts, utils.rows.build, compact)
+        utils.instrument.emit(self.graph.hooks, 'select', 
+            selection='post insights', 
+            items=sum(len(post) for post in self._succeeded(rows)), 
+            fetch=fetched - start, 
+            parse=utils.instrument.timer() - fetched)
+        return rows
+
+    def to_arrays(self):
+        return self._each(self.get_datasets(), utils.columnar.arrays)
+
+    def to_frame(self):
+        return self._each(self.get_datasets(), utils.columnar.frame)
+
+    def get(self):
+        return self._each(self.get_rows(), self._simplify)
+
+    def serialize(self, flat=False, timestamp=False):
+        return self._each(self.get_rows(), self._serialize, flat, timestamp)
+
+    def export(self, sink, flat=False, timestamp=False, rows=None):
+        """ Like `InsightsSelection.export`, with the 
+        post id as the first column of every row. """
+        if rows is None:
+            posts = self.get_rows(compact=True)
+        else:
+            posts = rows
+        sink.begin(self.columns(posts, flat))
+        for id, rows in posts.items():
+            # there's nothing to write for posts that failed
+            if isinstance(rows, Exception):
+                continue
+            for row in self._serialized(rows, flat, timestamp):
+                sink.write(OrderedDict([('id', id)] + list(row.items())))
+        return sum(len(rows) for rows in self._succeeded(posts))
+
+    def columns(self, rows, flat=False):
+        return ['id'] + utils.export.schema(self._succeeded(rows), flat, self.NESTED_METRICS)
+
+    def __repr__(self):
+        if 'metrics' in self.meta:
+            metrics = ", ".join(self.meta['metrics'])
+        else:
+            metrics = 'all available metrics'
+
+        return u"<Insights for posts of '{}' ({})>".format(
+            repr(self.edge.edge.name), metrics)
+
+
 class Picture(object):
     def __init__(self, post, raw):
         self.post = post
@@ -292,16 +540,24 @@ class Picture(object):
 
 
 class Post(object):
+    # there can be many thousands of posts in memory, 
+    # so we keep them small and anything that takes 
+    # real work is only computed when first needed
+    __slots__ = (
+        'page', 'raw', 'id', 'type', 'name', 'story', 'link', 
+        'message', 'description', 'shares', 'comments', 'likes', 
+        '_graph', '_created_time', '_updated_time', 
+        '_quotes', '_links', '_picture', 
+        )
+
     def __init__(self, page, raw):
         self.page = page
         self.raw = raw
-        # most fields aside from id, type, ctime 
-        # and mtime are optional
-        self.graph = page.graph.partial(raw['id'])
+        # most fields aside from id and ctime are optional, 
+        # and when asking for specific fields, so are type 
+        # and mtime
         self.id = raw['id']
-        self.type = raw['type']
-        self.created_time = utils.date.parse(raw['created_time'])
-        self.updated_time = utils.date.parse(raw['updated_time'])
+        self.type = raw.get('type')
         self.name = raw.get('name')
         self.story = raw.get('story')
         self.link = raw.get('link')
@@ -312,23 +568,48 @@ class Post(object):
         # when getting post data, or just some
         self.comments = utils.api.getdata(raw, 'comments')
         self.likes = utils.api.getdata(raw, 'likes')
-        self.quotes = \
-            utils.extract_quotes(self.message or '') + \
-            utils.extract_quotes(self.description or '')
+
+    @lazy
+    def graph(self):
+        return self.page.graph.partial(self.id)
+
+    @lazy
+    def created_time(self):
+        return utils.date.parse(self.raw['created_time'])
+
+    @lazy
+    def updated_time(self):
+        if 'updated_time' in self.raw:
+            return utils.date.parse(self.raw['updated_time'])
+        else:
+            return None
+
+    @property
+    def text(self):
+        # the message and the description of any embedded 
+        # media, on separate lines so quotes can't span both
+        return (self.message or '') + '\n' + (self.description or '')
+
+    @lazy
+    def quotes(self):
+        return utils.extract.quotes(self.text)
+
+    @lazy
+    def links(self):
         # `self.link` is part of Facebook's post schema
         # `self.links` extracts links from the message and 
         # the description of any embedded media
-        self.links = set(
-            utils.extract_links(self.message or '') + \
-            utils.extract_links(self.description or '')
-            )
+        links = set(utils.extract.links(self.text))
         if self.link:
-            self.links.add(self.link)
+            links.add(self.link)
+        return links
 
-        if 'picture' in raw:
-            self.picture = Picture(self, raw['picture'])
+    @lazy
+    def picture(self):
+        if 'picture' in self.raw:
+            return Picture(self, self.raw['picture'])
         else:
-            self.picture = None
+            return None
 
     @property
     def insights(self):
@@ -346,7 +627,7 @@ class Post(object):
             return link
 
     def resolve_links(self, clean=False):
-        links = set([utils.url.resolve(link) for link in self.links])
+        links = set(utils.url.resolve_all(self.links).values())
         if clean:
             return set([utils.url.base(link) for link in links])
         else:
@@ -357,15 +638,93 @@ class Post(object):
         return u"<Post: {} ({})>".format(self.id, time)
 
 
+def resolve_links(posts, clean=False, **options):
+    """ Resolve the links of many posts at once. Links that 
+    show up in more than one post are only resolved once. 
+    Returns a dictionary of resolved links by post id. """
+    posts = list(posts)
+    links = [link for post in posts for link in post.links]
+    resolved = utils.url.resolve_all(links, **options)
+
+    if clean:
+        resolved = {link: utils.url.base(location) 
+            for link, location in resolved.items()}
+
+    return {post.id: set([resolved[link] for link in post.links]) 
+        for post in posts}
+
+
+def extract(posts):
+    """ Extract quotes and links from many posts at once. 
+    Returns quotes and links by post id and an index of 
+    post ids by link, so there's no need to go through 
+    every post again to find the ones that share a link. 
+    Posts remember their quotes and links as well. """
+    posts = list(posts)
+    quotes, links = utils.extract.bulk((post.id, post.text) for post in posts)
+    for post in posts:
+        if post.link:
+            links[post.id].add(post.link)
+        post._quotes = quotes[post.id]
+        post._links = links[post.id]
+
+    return utils.extract.Extracts(quotes, links, utils.extract.index(links))
+
+
+# long-running processes create pages for the same tokens 
+# over and over, but page metadata and the metrics that are 
+# available hardly ever change
+METADATA_TTL = 60 * 60
+METADATA_SIZE = 10000
+
+def _scope(page, period=None):
+    # pages for the same token share metadata, 
+    # but the cache doesn't hold on to any page
+    return (page.token, page.graph._resolve_endpoint([]), period)
+
+
 class Page(object):
-    def __init__(self, token):
-        self.graph = GraphAPI(token).partial('me')
-        data = self.graph.get()
-        self.raw = data
-        self.id = data['id']
-        #self.username = data['username']
-        self.name = data['name']
-        self.link = data.get('link')
+    def __init__(self, token, lazy=False, cache=None, root=None):
+        # pages created from the same root client 
+        # share a single connection pool
+        if root is None:
+            root = GraphAPI(token, cache=cache)
+        else:
+            root = root.with_token(token)
+        self.graph = root.partial('me')
+        # lazy pages don't fetch any page metadata 
+        # until it is first needed
+        if not lazy:
+            self.raw
+
+    @memoize(size=METADATA_SIZE, ttl=METADATA_TTL, key=_scope)
+    def _metadata(self):
+        return self.graph.get()
+
+    @property
+    def raw(self):
+        return self._metadata()
+
+    @memoize(size=METADATA_SIZE, ttl=METADATA_TTL, key=_scope)
+    def metrics(self, period=None):
+        """ Names of the metrics that Facebook returns 
+        for this page by default, for every period or 
+        only for `day`, `week`, `days_28` or `lifetime`. """
+        options = {'period': period} if period else {}
+        datasets = self.graph.get('insights', **options)['data']
+        return sorted(set(dataset['name'] for dataset in datasets))
+
+    @property
+    def id(self):
+        return self.raw['id']
+
+    @property
+    def name(self):
+        return self.raw['name']
+
+    @property
+    def link(self):
+        return self.raw.get('link')
 
     @property
     def token(self):
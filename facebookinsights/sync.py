@@ -0,0 +1,129 @@
+# encoding: utf-8
+
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from . import utils
+
+
+# some metrics keep changing for a couple of days
+# after the fact, so we fetch these days again
+LOOKBACK = 3
+
+
+class Store(object):
+    """ A local SQLite store of insights rows, by edge (a page
+    or a post), metric and period, that makes it possible to
+    only fetch the days we don't have yet. """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS insights (
+                    edge TEXT,
+                    metric TEXT,
+                    period TEXT,
+                    end_time TEXT,
+                    value TEXT,
+                    PRIMARY KEY (edge, metric, period, end_time)
+                )""")
+
+    def last(self, edge, metric, period):
+        """ The end time of the last row we have, if any. """
+        with self.lock:
+            end_time = self.db.execute("""
+                SELECT MAX(end_time) FROM insights
+                WHERE edge = ? AND metric = ? AND period = ?""",
+                (edge, metric, period)).fetchone()[0]
+
+        if end_time:
+            return utils.date.parse(end_time)
+        else:
+            return None
+
+    def save(self, edge, period, rows):
+        records = []
+        for row in rows:
+            row = row._asdict()
+            end_time = row.pop('end_time').isoformat()
+            for metric, value in row.items():
+                if value is not None:
+                    value = json.dumps(value, default=utils.cache.encode)
+                    records.append((edge, metric, period, end_time, value))
+
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO insights VALUES (?, ?, ?, ?, ?)",
+                records)
+
+        return len(records)
+
+    def load(self, edge, metrics, period, since=None, until=None):
+        """ Stored rows as dictionaries, ordered by end time. """
+        query = """
+            SELECT end_time, metric, value FROM insights
+            WHERE edge = ? AND period = ? AND metric IN ({})""".format(
+            ", ".join('?' for metric in metrics))
+        params = [edge, period] + list(metrics)
+
+        if since:
+            query += " AND end_time >= ?"
+            params.append(utils.date.date(since).isoformat())
+        if until:
+            query += " AND end_time < ?"
+            until = utils.date.date(until) + timedelta(days=1)
+            params.append(until.isoformat())
+
+        with self.lock:
+            records = self.db.execute(
+                query + " ORDER BY end_time", params).fetchall()
+
+        rows = []
+        for end_time, metric, value in records:
+            end_time = utils.date.parse(end_time)
+            if not rows or rows[-1]['end_time'] != end_time:
+                row = utils.record(metrics)
+                row['end_time'] = end_time
+                rows.append(row)
+            rows[-1][metric] = json.loads(value, parse_float=Decimal)
+
+        return rows
+
+    def sync(self, selection, since, until=None, lookback=LOOKBACK):
+        """ Fetch and save the rows for an insights selection
+        that we don't have yet, starting from `since` for metrics
+        we've never synced before and from `lookback` days before
+        the last row we have for everything else. Returns the
+        rows that were fetched. """
+        period = selection.params.get('period')
+        metrics = selection.meta.get('metrics')
+
+        if not metrics:
+            raise ValueError("Can only sync selections with explicit metrics.")
+        if period in (None, 'lifetime'):
+            raise ValueError("Can only sync daily, weekly or monthly insights.")
+
+        edge = selection.edge.id
+        since = utils.date.date(since, utc=True)
+        until = utils.date.date(until, utc=True) or date.today()
+
+        # a single request for all metrics, starting from
+        # the metric that is furthest behind
+        start = until
+        for metric in metrics:
+            last = self.last(edge, metric, period)
+            if last:
+                start = min(start, last.date() - timedelta(days=lookback))
+            else:
+                start = since
+                break
+        start = max(start, since)
+
+        rows = selection.range(start, until).get_rows()
+        self.save(edge, period, rows)
+        return rows
@@ -1,16 +1,57 @@
-import facebookinsights as fi
+import os
+import gc
+import csv
+import json
+import time
+import shutil
+import socket
+import weakref
+import tempfile
 import unittest
+from datetime import datetime, timedelta
+
+import pytz
+import dateutil.parser
+
+import facebookinsights as fi
+from facebookinsights.utils.api import GraphAPI
+
+from . import mockapi
 
 
 class TestBase(unittest.TestCase):
     def setUp(self):
-        pages = fi.authorize()
-        if not len(pages):
-            raise Exception("Cannot proceed with unit testing: \
-                the authorized Facebook account does not have access \
-                to any Facebook Page Insights.")
-        
-        self.page = pages[0]
+        # these tests run against the live Graph API
+        token = os.environ.get('FACEBOOK_PAGE_TOKEN')
+        if not token:
+            raise unittest.SkipTest("Testing against the Graph API \
+                requires a page token in FACEBOOK_PAGE_TOKEN.")
+
+        self.page = fi.authenticate(token=token)
+
+
+class TestMock(unittest.TestCase):
+    """ Tests against a local mock of the Graph API, 
+    which need neither a token nor network access. """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = mockapi.Server(posts=500).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.stats = fi.utils.instrument.Stats()
+        self.root = GraphAPI(url=self.server.url, hooks=[self.stats])
+        self.page = fi.graph.Page('token', root=self.root)
+        self.now = self.server.graph.now
+
+    def mkdtemp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return directory
 
 
 class TestAuthorization(TestBase):
@@ -45,5 +86,578 @@ class TestQuerying(TestBase):
         """ It can limit the total amount of results. """
 
 
+class TestOffline(TestMock):
+    def test_range_chunking(self):
+        """ It should split up date ranges longer than three months 
+        into subranges and merge the results into a single set of 
+        rows, ordered by date and without duplicates. """
+        until = self.now - timedelta(days=1)
+        query = self.page.insights.daily(['page_impressions', 'page_fans'])
+        rows = query.range(until=until, days=200).get_rows()
+        end_times = [row.end_time for row in rows]
+        self.assertEqual(len(rows), 200)
+        self.assertEqual(end_times, sorted(set(end_times)))
+        self.assertTrue(all(row.page_impressions is not None for row in rows))
+        # three chunks of two metrics, in a single batch
+        self.assertEqual(self.stats.subrequests, 6)
+        self.assertEqual(self.stats.batches, 1)
+
+    def test_batching(self):
+        """ It should send more than 50 sub-requests as several 
+        batches at the same time, and return the responses in 
+        the order they were asked for. """
+        with mockapi.Server(latency=0.2) as server:
+            stats = fi.utils.instrument.Stats()
+            root = GraphAPI(url=server.url, hooks=[stats])
+            metrics = ['metric_{}'.format(i) for i in range(120)]
+            paramsets = [{'relative_url': metric} for metric in metrics]
+            responses = root.partial('me').all('insights', paramsets, period='lifetime')
+            self.assertEqual([response['data'][0]['name'] for response in responses], metrics)
+            self.assertEqual(stats.batches, 3)
+            self.assertEqual(stats.subrequests, 120)
+            self.assertEqual(server.requests, 3)
+            self.assertEqual(server.peak, 3)
+
+    def test_pacing(self):
+        """ It should space out requests once usage passes its
+        threshold, for every token when it's application usage
+        but only for the token it was reported for when it's
+        page usage, and pause all requests after a throttle. """
+        scheduler = fi.utils.ratelimit.Scheduler(threshold=50, max_delay=0.1)
+        self.server.headers['x-page-usage'] = json.dumps({'call_count': 100})
+        self.addCleanup(self.server.headers.clear)
+        GraphAPI('a', url=self.server.url, scheduler=scheduler).get('me')
+        self.assertEqual(scheduler.usage, {('x-page-usage', 'a'): 100})
+
+        start = time.time()
+        def request(token):
+            scheduler.wait(token)
+            return time.time() - start
+        delays = fi.utils.parallel.map(request, 'aaaab', workers=5)
+        paced = sorted(delays[:4])
+        self.assertTrue(all(later - earlier > 0.09
+            for earlier, later in zip(paced, paced[1:])), paced)
+        self.assertLess(delays[4], 0.05)
+
+        scheduler.update({'x-app-usage': json.dumps({'call_count': 100})})
+        scheduler.reserve('b')
+        self.assertGreater(scheduler.reserve('b'), 0.05)
+
+        scheduler = fi.utils.ratelimit.Scheduler(backoff=0.2)
+        delay = scheduler.throttled(0)
+        self.assertTrue(0.1 <= delay <= 0.2)
+        self.assertGreater(scheduler.reserve('b'), 0.05)
+
+    def test_throttled_batch(self):
+        """ It should retry throttled sub-requests, and only
+        those, rather than failing or resending the batch. """
+        stats = fi.utils.instrument.Stats()
+        scheduler = fi.utils.ratelimit.Scheduler(backoff=0.05)
+        root = GraphAPI(url=self.server.url, scheduler=scheduler, hooks=[stats])
+        self.server.graph.throttle.update({'metric_1': 2, 'metric_3': 1})
+        self.addCleanup(self.server.graph.throttle.clear)
+        metrics = ['metric_{}'.format(i) for i in range(5)]
+        paramsets = [{'relative_url': metric} for metric in metrics]
+        responses = root.partial('me').all('insights', paramsets, period='lifetime')
+        self.assertEqual([response['data'][0]['name'] for response in responses], metrics)
+        # the whole batch, then metrics 1 and 3, then metric 1
+        self.assertEqual(stats.requests, 3)
+        self.assertEqual(stats.subrequests, 5)
+        self.assertEqual(stats.retries, 3)
+
+    def test_sqlite_cache(self):
+        """ It should expire entries after their ttl, evict the 
+        least recently used entries beyond its size, remember 
+        negative entries and keep count across connections. """
+        path = os.path.join(self.mkdtemp(), 'cache.db')
+        cache = fi.utils.cache.SQLiteCache(path, size=3, flush_every=2)
+        cache.set('expired', 1, ttl=-1)
+        with self.assertRaises(KeyError):
+            cache.get('expired')
+        with self.assertRaises(KeyError):
+            cache.get('missing')
+        self.assertEqual(len(cache), 0)
+
+        # dead links are cached as `None`
+        cache.set('dead', None)
+        self.assertIsNone(cache.get('dead'))
+        cache.delete('dead')
+
+        for key in 'abc':
+            cache.set(key, {'value': key})
+        # `a` was used last, even though that 
+        # lookup is not yet saved when `d` comes in
+        cache.get('a')
+        cache.set('d', [1.5])
+        self.assertEqual(len(cache), 3)
+        with self.assertRaises(KeyError):
+            cache.get('b')
+        self.assertEqual(cache.get('a'), {'value': 'a'})
+        self.assertEqual(cache.get('d'), [1.5])
+        cache.close()
+
+        cache = fi.utils.cache.SQLiteCache(path, size=3)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get('a'), {'value': 'a'})
+        cache.delete('a')
+        cache.delete('a')
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_resolve_links(self):
+        """ It should follow redirects, remember dead links 
+        and keep links whose destination won't answer a 
+        HEAD request, but not remember timeouts. """
+        cache = fi.utils.cache.MemoryCache()
+        resolver = fi.utils.url.Resolver(cache=cache)
+        url = self.server.url + '/redirect/{}'
+        self.assertEqual(resolver.resolve(url.format(200)), self.server.url + '/status/200')
+        self.assertEqual(resolver.resolve(url.format(405)), self.server.url + '/status/405')
+        for status in [404, 410]:
+            with self.assertRaises(fi.utils.url.DeadLinkError):
+                resolver.resolve(url.format(status))
+            self.assertIsNone(cache.get(url.format(status)))
+        requests = self.server.requests
+        with self.assertRaises(fi.utils.url.DeadLinkError):
+            resolver.resolve(url.format(404))
+        self.assertEqual(self.server.requests, requests)
+
+        # nothing listens on a port that was just given up
+        closed = socket.socket()
+        closed.bind(('localhost', 0))
+        unreachable = 'http://{}:{}/redirect/200'.format(*closed.getsockname())
+        closed.close()
+        with self.assertRaises(fi.utils.url.requests.ConnectionError):
+            resolver.resolve(unreachable)
+        self.assertIsNone(cache.get(unreachable))
+
+        resolved = resolver.resolve_all([url.format(200), url.format(404), unreachable])
+        self.assertEqual(resolved[url.format(200)], self.server.url + '/status/200')
+        self.assertEqual(resolved[url.format(404)], url.format(404))
+
+        class Slow(object):
+            def head(self, url, **options):
+                raise fi.utils.url.requests.Timeout()
+
+        resolver = fi.utils.url.Resolver(cache=cache, session=Slow())
+        with self.assertRaises(fi.utils.url.requests.Timeout):
+            resolver.resolve(url.format(500))
+        with self.assertRaises(KeyError):
+            cache.get(url.format(500))
+
+    def test_response_cache(self):
+        """ It should cache settled insights for longer than recent 
+        ones, only ask for what it doesn't have yet and never 
+        share responses between tokens. """
+        ttl = fi.utils.api.ttl
+        today = datetime.now(pytz.utc)
+        old = today - timedelta(days=30)
+
+        def response(*end_times):
+            values = [{'value': 1, 'end_time': end_time.strftime('%Y-%m-%dT%H:%M:%S+0000')} 
+                for end_time in end_times]
+            return {'data': [{'name': 'page_fans', 'values': values}]}
+
+        lifetime = {'data': [{'name': 'post_impressions', 'values': [{'value': 1}]}]}
+        self.assertEqual(ttl(response(old)), fi.utils.api.SETTLED_TTL)
+        self.assertEqual(ttl(response(old, today)), fi.utils.api.UNSETTLED_TTL)
+        self.assertEqual(ttl(lifetime), fi.utils.api.UNSETTLED_TTL)
+        self.assertEqual(ttl(lifetime, created=today), fi.utils.api.UNSETTLED_TTL)
+        self.assertEqual(ttl(lifetime, created=old), fi.utils.api.SETTLED_TTL)
+
+        cache = fi.utils.cache.MemoryCache()
+        root = GraphAPI(url=self.server.url, hooks=[self.stats], cache=cache)
+        page = fi.graph.Page('token', root=root)
+        until = self.now - timedelta(days=1)
+        query = page.insights.daily(['page_impressions', 'page_fans']).range(until=until, days=10)
+        rows = query.get_rows()
+        requests = self.server.requests
+        self.assertEqual(query.get_rows(), rows)
+        self.assertEqual(self.server.requests, requests)
+        # one of these is new
+        page.insights.daily(['page_fans', 'page_stories']).range(until=until, days=10).get_rows()
+        self.assertEqual(self.server.requests, requests + 1)
+        self.assertEqual(self.stats.subrequests, 3)
+        self.assertEqual((self.stats.hits, self.stats.misses), (3, 3))
+
+        # lifetime insights for posts from years ago are settled
+        page.posts.latest(2).insights.lifetime(['post_impressions']).get()
+        expires = [expires for value, expires in cache.entries.values()]
+        self.assertTrue(all(expires > time.time() + fi.utils.api.UNSETTLED_TTL 
+            for expires in expires[-2:]))
+
+        other = fi.graph.Page('other token', root=root, lazy=True)
+        requests = self.server.requests
+        other.insights.daily(['page_impressions', 'page_fans']).range(until=until, days=10).get_rows()
+        self.assertEqual(self.server.requests, requests + 1)
+        self.assertEqual(self.stats.hits, 3)
+
+    def test_range_limit(self):
+        """ It should ask for no more than 93 days at a time, 
+        counting the last day of a range too. """
+        until = self.now - timedelta(days=1)
+        for metrics in [None, ['page_fans']]:
+            query = self.page.insights.daily(metrics)
+            self.assertTrue(query.range(until=until, days=93).is_valid)
+            self.assertFalse(query.range(until=until, days=94).is_valid)
+            for days in [93, 94]:
+                rows = query.range(until=until, days=days).get_rows()
+                self.assertEqual(len(rows), days)
+
+    def test_parse_dates(self):
+        """ It should parse Graph API timestamps without dateutil, 
+        with any offset, and anything else with dateutil. """
+        parse = fi.utils.date.parse
+        for timestamp in [
+                '2014-08-19T07:00:00+0000', 
+                '2014-08-19T07:00:00-0500', 
+                '2014-08-19T23:59:59+05:30', 
+                '2014-08-19T00:00:00-09:30', 
+                ]:
+            self.assertTrue(fi.utils.date.GRAPH_TIMESTAMP.match(timestamp))
+            self.assertEqual(parse(timestamp), dateutil.parser.parse(timestamp))
+            self.assertEqual(parse(timestamp).utcoffset(), 
+                dateutil.parser.parse(timestamp).utcoffset())
+        self.assertIs(parse('2014-08-19T07:00:00+0000').tzinfo, pytz.utc)
+        self.assertEqual(parse('2014-08-19T07:00:00-0500').astimezone(pytz.utc).hour, 12)
+
+        for datestring in ['2014-08-19', '2014-08-19 07:00', 'August 19, 2014', '2014-08-19T07:00:00Z']:
+            self.assertFalse(fi.utils.date.GRAPH_TIMESTAMP.match(datestring))
+            self.assertEqual(parse(datestring), dateutil.parser.parse(datestring))
+
+    def test_arrays(self):
+        """ It should turn numeric metrics into float arrays, 
+        with NaN for missing values, and anything else into 
+        object arrays. """
+        try:
+            import numpy as np
+        except ImportError:
+            raise unittest.SkipTest("Columnar results require NumPy.")
+
+        def values(*values):
+            return [{'value': value, 'end_time': '2014-01-0{}T08:00:00+0000'.format(i + 1)} 
+                for i, value in enumerate(values)]
+
+        datasets = [
+            {'name': 'page_fans', 'values': values(1, None, 3)}, 
+            {'name': 'page_fans_country', 'values': values({'US': 1}, None, {'US': 3})}, 
+            # a later chunk
+            {'name': 'page_fans', 'values': values(1, 2, 3, 4)[3:]}, 
+            ]
+        columns = fi.utils.columnar.arrays(datasets)
+        self.assertEqual(len(columns['end_time']), 4)
+        self.assertEqual(columns['page_fans'].dtype, np.float64)
+        self.assertEqual(columns['page_fans'][[0, 2, 3]].tolist(), [1, 3, 4])
+        self.assertTrue(np.isnan(columns['page_fans'][1]))
+        self.assertEqual(columns['page_fans_country'].dtype, object)
+        self.assertEqual(columns['page_fans_country'][1], None)
+
+        rows = self.page.insights.daily(['page_impressions', 'page_fans_country']).range(
+            until=self.now - timedelta(days=1), days=5)
+        columns = rows.to_arrays()
+        self.assertEqual(columns['page_impressions'].dtype, np.float64)
+        self.assertEqual(len(columns['page_fans_country']), 5)
+
+    def test_post_insights(self):
+        """ It should fetch insights for many posts in batches, 
+        keyed by post id, with the error for posts that failed 
+        and without losing the results for any other post. """
+        posts = self.page.posts.latest(20)
+        query = posts.insights.lifetime(['post_impressions', 'post_consumptions'])
+        results = query.get()
+        self.assertEqual(list(results), ['1234_{}'.format(i) for i in range(20)])
+        self.assertEqual(self.stats.subrequests, 40)
+        for i in [9, 19]:
+            self.assertIsInstance(results['1234_{}'.format(i)], fi.utils.api.facepy.FacebookError)
+        for i in [8, 18]:
+            self.assertIsNone(results['1234_{}'.format(i)])
+        self.assertEqual(results['1234_0'].post_impressions, 0)
+        self.assertEqual(posts.insights.lifetime('post_impressions').get()['1234_1'], 0)
+
+        path = os.path.join(self.mkdtemp(), 'posts.ndjson')
+        with fi.utils.export.NDJSON(path) as sink:
+            self.assertEqual(query.export(sink), 16)
+        with open(path) as f:
+            ids = [json.loads(line)['id'] for line in f]
+        self.assertNotIn('1234_9', ids)
+
+    def test_incremental_sync(self):
+        """ It should only fetch the days after the last row 
+        in the local store, plus the look-back window. """
+        metrics = ['page_impressions', 'page_fans']
+        query = self.page.insights.daily(metrics)
+        store = fi.sync.Store(':memory:')
+        until = self.now - timedelta(days=3)
+        since = until - timedelta(days=29)
+        synced = store.sync(query, since, until)
+        self.assertEqual(len(synced), 30)
+        last = store.last(self.page.id, 'page_fans', 'day')
+        # two new days, and the three days before those again
+        until = self.now - timedelta(days=1)
+        rows = store.sync(query, since, until, lookback=3)
+        expected = query.range(last.date() - timedelta(days=3), until).get_rows()
+        self.assertEqual(rows, expected)
+        self.assertLess(len(rows), len(synced))
+        stored = store.load(self.page.id, metrics, 'day')
+        end_times = set(row.end_time for row in synced + rows)
+        self.assertEqual([row['end_time'] for row in stored], sorted(end_times))
+        self.assertEqual(stored[-1]['page_fans'], rows[-1].page_fans)
+
+    def test_streaming_export(self):
+        """ It should write serialized rows to NDJSON and CSV sinks 
+        one at a time, with a column for every flattened key. """
+        metrics = ['page_impressions', 'page_impressions_by_country_unique']
+        query = self.page.insights.daily(metrics).range(
+            until=self.now - timedelta(days=1), days=10)
+        expected = query.serialize(flat=True)
+
+        path = os.path.join(self.mkdtemp(), 'insights')
+
+        with fi.utils.export.NDJSON(path + '.ndjson') as sink:
+            self.assertEqual(query.export(sink, flat=True), 10)
+        with open(path + '.ndjson') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, expected)
+
+        with fi.utils.export.CSV(path + '.csv') as sink:
+            query.export(sink, flat=True)
+            # the header is out, so columns it doesn't have are an error
+            with self.assertRaises(ValueError):
+                sink.begin(['end_time', 'page_fans'])
+            with self.assertRaises(ValueError):
+                sink.write({'end_time': 0, 'page_fans': 1})
+        with open(path + '.csv') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 10)
+        columns = set(key for row in expected for key in row)
+        self.assertEqual(set(rows[0].keys()), columns)
+        self.assertIn('page_impressions_by_country_unique_US', columns)
+
+    def test_commands(self):
+        """ It should export insights from the command line,
+        and refuse date ranges without a start. """
+        try:
+            from click.testing import CliRunner
+            from facebookinsights import commands
+        except ImportError:
+            raise unittest.SkipTest("The command-line interface requires click and keyring.")
+
+        def insights(*arguments):
+            arguments = list(arguments) + ['-t', 'token', '--graph-url', self.server.url, '-q']
+            return CliRunner().invoke(commands.cli, arguments)
+
+        for command in ['page', 'posts']:
+            result = insights(command, '--until', '2014-12-05')
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn('--until requires', result.output)
+
+        result = insights('page', '--until', '2014-12-05', '--days', '3', '-M', 'page_impressions')
+        self.assertEqual(result.exit_code, 0, result.output)
+        rows = [json.loads(line) for line in result.output.splitlines()]
+        # days end at midnight Pacific time
+        self.assertEqual([row['end_time'][:10] for row in rows],
+            ['2014-12-04', '2014-12-05', '2014-12-06'])
+        self.assertEqual(set(row['page'] for row in rows), set(['Mock Page']))
+
+    def test_compiled_flatten(self):
+        """ It should flatten rows exactly like `utils.flatten`, 
+        including keys that only show up partway through a range 
+        and nested metrics that are to be left alone. """
+        skip = fi.graph.InsightsSelection.NESTED_METRICS
+        # metrics are skipped by name, not because 
+        # their name is part of a nested metric's
+        self.assertIn('page_fans_online', skip)
+        self.assertNotIn('page_fans', skip)
+        flatten = fi.utils.flat.Flattener(skip=skip)
+        rows = []
+        for day in range(10):
+            row = {
+                'end_time': str(day), 
+                'page_impressions': day, 
+                'page_fans_gender_age': self.server.graph.value('page_fans_gender_age', day), 
+                'page_fans_online': {'0': day, '1': day + 1}, 
+                'page_fans_country': {'US': day, 'BE': {'VLG': day}}, 
+                }
+            if day > 5:
+                row['page_fans_country']['ZZ'] = day
+            rows.append(row)
+
+        for row in rows:
+            self.assertEqual(flatten(row), fi.utils.flatten(row, skip=skip))
+        self.assertEqual(flatten(rows[-1])['page_fans_country_ZZ'], 9)
+        self.assertEqual(flatten(rows[-1])['page_fans_country_BE_VLG'], 9)
+        self.assertEqual(flatten(rows[-1])['page_fans_online'], {'0': 9, '1': 10})
+        self.assertNotIn('page_fans_country_ZZ', flatten(rows[0]))
+
+    def test_crawl(self):
+        """ It should return the same posts as `get` when crawling 
+        a date range in concurrent time windows, newest first and 
+        without duplicates at the edges of windows. """
+        if not hasattr(time, 'tzset'):
+            raise unittest.SkipTest("Changing timezones requires `time.tzset`.")
+
+        def restore(tz):
+            if tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = tz
+            time.tzset()
+
+        self.addCleanup(restore, os.environ.get('TZ'))
+        # date ranges are in local time, windows should be too
+        for tz in ['UTC', 'Asia/Tokyo', 'America/New_York']:
+            os.environ['TZ'] = tz
+            time.tzset()
+            query = self.page.posts.range(
+                since=self.now - timedelta(days=60), 
+                until=self.now - timedelta(days=2))
+            posts = [post.id for post in query.get()]
+            self.assertTrue(posts)
+            for windows in [1, 6, 7]:
+                crawled = [post.id for post in query.crawl(windows=windows)]
+                self.assertEqual(crawled, posts, tz)
+
+    def test_aio(self):
+        """ The asyncio client should give the same results as
+        the blocking client, and refuse to block the event loop. """
+        try:
+            import asyncio
+            from facebookinsights import aio
+        except (ImportError, SyntaxError):
+            raise unittest.SkipTest("The asyncio client requires Python 3.6+ and aiohttp.")
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        run = loop.run_until_complete
+        root = aio.GraphAPI(url=self.server.url)
+        self.addCleanup(lambda: run(root.close()))
+        page = run(aio.Page('token', root=root).load())
+        self.assertEqual(page.name, self.page.name)
+
+        until = self.now - timedelta(days=1)
+        metrics = ['page_impressions', 'page_fans_country']
+        rows = run(page.insights.daily(metrics).range(until=until, days=5).get_rows())
+        self.assertEqual(rows, self.page.insights.daily(metrics).range(until=until, days=5).get_rows())
+
+        query = page.posts.range(
+            since=self.now - timedelta(days=30),
+            until=self.now - timedelta(days=2))
+        posts = [post.id for post in run(query.get())]
+        self.assertTrue(posts)
+        self.assertEqual(posts, [post.id for post in self.page.posts.range(
+            since=self.now - timedelta(days=30),
+            until=self.now - timedelta(days=2)).get()])
+        self.assertEqual([post.id for post in run(query.crawl(windows=4))], posts)
+
+        links = run(page.posts.latest(3).extract()).links
+        self.assertIn('http://bit.ly/1', links['1234_1'])
+        with self.assertRaises(TypeError):
+            list(query)
+        with self.assertRaises(TypeError):
+            query[0]
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        results = run(page.posts.latest(10).insights.lifetime('post_impressions').to_arrays())
+        self.assertEqual(results['1234_0']['post_impressions'].tolist(), [0])
+        self.assertIsInstance(results['1234_9'], fi.utils.api.facepy.FacebookError)
+
+    def test_extract(self):
+        """ It should find links separated by newlines or punctuation 
+        and index the posts that share a link. """
+        posts = [
+            fi.graph.Post(self.page, {
+                'id': '1', 
+                'message': 'Read "the story" at http://example.com/a.\nhttp://example.com/b', 
+                'link': 'http://example.com/c', 
+                }), 
+            fi.graph.Post(self.page, {
+                'id': '2', 
+                'message': 'More (http://example.com/b), and http://example.com/(d)!', 
+                }), 
+            fi.graph.Post(self.page, {'id': '3'}), 
+            fi.graph.Post(self.page, {
+                'id': '4', 
+                'message': 'A quote from "', 
+                'description': 'the description" is not a quote', 
+                }), 
+            ]
+        extracts = fi.graph.extract(posts)
+        self.assertEqual(extracts.quotes['1'], ['the story'])
+        self.assertEqual(extracts.links['1'], set([
+            'http://example.com/a', 'http://example.com/b', 'http://example.com/c']))
+        self.assertEqual(extracts.links['2'], set([
+            'http://example.com/b', 'http://example.com/(d)']))
+        self.assertEqual(extracts.links['3'], set())
+        # a quote can't start in the message and end in the description
+        self.assertEqual(extracts.quotes['4'], [])
+        self.assertEqual(sorted(extracts.index['http://example.com/b']), ['1', '2'])
+        # posts remember what was extracted in bulk, 
+        # and extracting one post at a time agrees
+        for post in posts:
+            self.assertEqual(post.links, extracts.links[post.id])
+            self.assertEqual(post.quotes, fi.utils.extract.quotes(post.text))
+            self.assertEqual(post.links, set(fi.utils.extract.links(post.text)) | 
+                set([post.link] if post.link else []))
+
+    def test_memoize(self):
+        """ It should evict the least recently used results beyond 
+        its size, expire results after their ttl and cache methods 
+        separately for every instance. """
+        calls = []
+
+        @fi.utils.functional.memoize(size=2)
+        def square(n):
+            calls.append(n)
+            return n * n
+
+        square(1), square(2), square(1), square(3), square(1), square(2)
+        # 2 was least recently used when 3 came in
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(square.stats(), {'hits': 2, 'misses': 4, 'size': 2})
+
+        @fi.utils.functional.memoize(ttl=0.05)
+        def now():
+            return time.time()
+
+        self.assertEqual(now(), now())
+        earlier = now()
+        time.sleep(0.1)
+        self.assertNotEqual(now(), earlier)
+
+        class Counter(object):
+            def __init__(self, start):
+                self.start = start
+
+            @fi.utils.functional.memoize(size=10)
+            def count(self, n):
+                calls.append(n)
+                return self.start + n
+
+        a, b = Counter(0), Counter(100)
+        del calls[:]
+        self.assertEqual([a.count(1), b.count(1), a.count(1)], [1, 101, 1])
+        self.assertEqual(calls, [1, 1])
+        # instances are not kept alive by their results
+        counter = weakref.ref(a)
+        del a
+        gc.collect()
+        self.assertIsNone(counter())
+
+        # pages for the same token share their metadata
+        fi.graph.Page.metrics.clear()
+        page = weakref.ref(fi.graph.Page('token', root=self.root))
+        gc.collect()
+        self.assertIsNone(page())
+        requests = self.stats.requests
+        self.assertEqual(fi.graph.Page('token', root=self.root).name, self.page.name)
+        self.assertEqual(self.page.metrics(), self.page.metrics())
+        fi.graph.Page('token', root=self.root).metrics()
+        self.assertEqual(self.stats.requests, requests + 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
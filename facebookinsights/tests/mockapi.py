@@ -0,0 +1,272 @@
+# encoding: utf-8
+
+"""
+A local stand-in for the Graph API, just realistic enough to
+test and benchmark `facebookinsights` without a token or
+network access. It serves page metadata, paginated posts,
+insights (including breakdown metrics with nested values, 
+posts without any insights at all and throttled metrics) and 
+batch requests, with a configurable latency for every HTTP 
+request, as well as links that redirect to a page with any 
+status code.
+"""
+
+from __future__ import print_function
+
+import json
+import math
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+except ImportError:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+
+
+EPOCH = datetime(1970, 1, 1)
+COUNTRIES = ['US', 'GB', 'BE', 'NL', 'FR', 'DE', 'IN', 'BR', 'MX', 'CA']
+AGES = ['13-17', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+# the longest range the Graph API accepts for insights
+MAX_SPAN = timedelta(days=93)
+
+
+def _format(date):
+    return date.strftime('%Y-%m-%dT%H:%M:%S+0000')
+
+def _timestamp(value, default):
+    if value is None:
+        return default
+    return EPOCH + timedelta(seconds=int(value))
+
+
+class Graph(object):
+    """ Generates Graph API responses. """
+
+    def __init__(self, posts=1000, page_size=25, interval=timedelta(hours=6), now=None):
+        self.posts = posts
+        self.page_size = page_size
+        self.interval = interval
+        self.now = now or datetime(2015, 1, 1)
+        # metric => how many more times to refuse 
+        # it because we've hit a rate limit
+        self.throttle = {}
+
+    def me(self, query):
+        return {'id': '1234', 'name': 'Mock Page', 'link': 'http://example.com/mock'}
+
+    def post(self, i):
+        created_time = _format(self.now - self.interval * i)
+        return {
+            'id': '1234_{}'.format(i),
+            'type': 'link',
+            'created_time': created_time,
+            'updated_time': created_time,
+            'message': 'Read "all about story {}" at http://bit.ly/{} today'.format(i, i % 50),
+            'description': 'A description with another link http://example.com/{}'.format(i),
+            'link': 'http://example.com/story/{}'.format(i),
+            'picture': 'https://external.xx.fbcdn.net/safe_image.php?w=130&h=130&url=http%3A%2F%2Fexample.com%2F{}.jpg'.format(i),
+            }
+
+    def feed(self, url, query):
+        # posts are spaced `interval` apart, newest first
+        if 'offset' in query:
+            offset = int(query['offset'])
+        elif 'until' in query:
+            until = _timestamp(query['until'], self.now)
+            offset = max(0, int(math.ceil(
+                (self.now - until).total_seconds() / self.interval.total_seconds())))
+        else:
+            offset = 0
+        limit = int(query.get('limit', self.page_size))
+        data = [self.post(i) for i in range(offset, min(offset + limit, self.posts))]
+        response = {'data': data}
+        if offset + limit < self.posts:
+            response['paging'] = {'next': '{}?offset={}&limit={}'.format(
+                url, offset + limit, limit)}
+        return response
+
+    def value(self, metric, day):
+        if 'country' in metric:
+            return dict((country, (day * 7 + i) % 1000) for i, country in enumerate(COUNTRIES))
+        elif 'gender_age' in metric:
+            return dict(('{}.{}'.format(gender, age), (day + i) % 500)
+                for gender in 'FMU' for i, age in enumerate(AGES))
+        else:
+            return (day * 31) % 10000
+
+    def insights(self, metric, query):
+        period = query.get('period', 'day')
+        if period == 'lifetime':
+            values = [{'value': self.value(metric, 0)}]
+        else:
+            until = _timestamp(query.get('until'), self.now)
+            since = _timestamp(query.get('since'), until - timedelta(days=3))
+            days = max(0, (until - since).days)
+            values = [{
+                'value': self.value(metric, day),
+                'end_time': _format(since + timedelta(days=day + 1, hours=7)),
+                } for day in range(days)]
+        return {'name': metric, 'period': period, 'values': values}
+
+    def respond(self, url, query):
+        segments = [segment for segment in urlparse(url).path.split('/') if segment]
+        if len(segments) == 1:
+            return self.me(query)
+        elif segments[1] == 'posts':
+            return self.feed(url.split('?')[0], query)
+        elif segments[1] == 'insights':
+            # not every post has insights, e.g. shared posts don't
+            if '_' in segments[0]:
+                post = int(segments[0].split('_')[1])
+                if post % 10 == 9:
+                    return {'error': {'message': '(#100) Tried accessing nonexisting '
+                        'field (insights)', 'code': 100}}
+                elif post % 10 == 8:
+                    return {'data': []}
+            if 'since' in query and 'until' in query:
+                span = _timestamp(query['until'], None) - _timestamp(query['since'], None)
+                if span > MAX_SPAN:
+                    return {'error': {'message': 'There cannot be more than 93 days '
+                        'between since and until', 'code': 100}}
+            if len(segments) > 2:
+                metric = segments[2]
+                if self.throttle.get(metric):
+                    self.throttle[metric] -= 1
+                    return {'error': {'message': '(#4) Application request '
+                        'limit reached', 'code': 4}}
+                metrics = [metric]
+            else:
+                metrics = ['page_impressions', 'page_fans', 'page_stories']
+            return {'data': [self.insights(metric, query) for metric in metrics]}
+        else:
+            return {'error': {'message': 'Unknown path', 'code': 100}}
+
+    def batch(self, requests):
+        responses = []
+        for request in requests:
+            url = '/' + request['relative_url'].lstrip('/')
+            query = dict(parse_qsl(urlparse(url).query))
+            body = self.respond(url, query)
+            responses.append({'code': 200, 'headers': [], 'body': json.dumps(body)})
+        return responses
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Server(object):
+    """ Runs a mock Graph API in a background thread.
+
+        with Server(latency=0.05, posts=5000) as server:
+            root = GraphAPI('token', url=server.url)
+    """
+
+    def __init__(self, latency=0, host='localhost', port=0, **options):
+        self.latency = latency
+        self.graph = Graph(**options)
+        self.requests = 0
+        self.bytes = 0
+        # sent along with every response, e.g. usage headers
+        self.headers = {}
+        # requests in flight, now and at most
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingServer((host, port), self.handler())
+        self.url = 'http://{}:{}'.format(*self.server.server_address[:2])
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # headers and body are written separately, which 
+                # without this would stall every keep-alive request
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *vargs):
+                pass
+
+            def reply(self, body):
+                with mock.lock:
+                    mock.active += 1
+                    mock.peak = max(mock.peak, mock.active)
+                if mock.latency:
+                    time.sleep(mock.latency)
+                data = json.dumps(body).encode('utf-8')
+                with mock.lock:
+                    mock.active -= 1
+                    mock.requests += 1
+                    mock.bytes += len(data)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in mock.headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                query = dict(parse_qsl(urlparse(self.path).query))
+                url = 'http://{}{}'.format(self.headers.get('Host'), self.path)
+                self.reply(mock.graph.respond(url, query))
+
+            def do_HEAD(self):
+                # links to resolve: /redirect/<status> 
+                # redirects to /status/<status>
+                segments = [segment for segment in self.path.split('/') if segment]
+                with mock.lock:
+                    mock.requests += 1
+                if segments[0] == 'redirect':
+                    self.send_response(301)
+                    self.send_header('Location', '/status/' + segments[1])
+                else:
+                    self.send_response(int(segments[1]))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+                self.reply(mock.graph.batch(json.loads(form['batch'])))
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with Server() as server:
+        print("Mock Graph API running at {}, press Ctrl+C to stop.".format(server.url))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -3,28 +3,32 @@
 from __future__ import unicode_literals
 
 from . import api
+from . import cache
+from . import columnar
 from . import date
+from . import export
+from . import extract
+from . import flat
 from . import functional
+from . import instrument
+from . import parallel
+from . import ratelimit
+from . import rows
 from . import server
 from . import url
+from .extract import QUOTE_PATTERN, LINK_PATTERN
 
-import re
 import textwrap
 
 
-QUOTE_PATTERN = re.compile(r'[\"\u201c\u201e\u00ab]\s?(.+?)\s?[\"\u201c\u201d\u00bb]')
-LINK_PATTERN = re.compile(r'https?://')
-
-
 def dedent(string):
     return textwrap.dedent(string).replace('\n', '')
 
 def extract_quotes(string):
-    return re.findall(QUOTE_PATTERN, string)
+    return extract.quotes(string)
 
 def extract_links(string):
-    words = string.split(' ')
-    return [word for word in words if re.match(LINK_PATTERN, word)]
+    return extract.links(string)
 
 def record(keys):
     placeholders = [None for key in keys]
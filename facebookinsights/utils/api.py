@@ -1,56 +1,190 @@
 # encoding: utf-8
 
 import copy
+import hashlib
+import itertools
+import datetime
 import facepy
+import pytz
 
+from . import date
+from . import instrument
+from . import parallel
+from . import ratelimit
 from . import url
 
+
+# connections kept open to the Graph API, 
+# shared by a client and all of its partials
+POOL_SIZE = 20
+
+# the Graph API accepts no more than 50 
+# sub-requests in a single batch request
+BATCH_SIZE = 50
+
+# insights for days well in the past hardly ever change 
+# anymore, but the numbers for recent days are still settling
+SETTLED_AFTER = datetime.timedelta(days=3)
+SETTLED_TTL = 60 * 60 * 24 * 30
+UNSETTLED_TTL = 60 * 15
+
+MISSING = object()
+
 def getdata(obj, key, default=None):
     if key in obj:
         return obj[key]['data']
     else:
         return default
 
+def serialize(value):
+    """ Format a value the way the Graph API expects 
+    it in field expansions, e.g. `true` rather than `True`. """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    else:
+        return str(value)
 
-class GraphAPI(facepy.GraphAPI):
-    def __init__(self, *vargs, **kwargs):
-        self.base = []
-        super(GraphAPI, self).__init__(*vargs, **kwargs)
+def cross(*dimensions):
+    """ The cross product of a number of lists of parameters, 
+    e.g. metrics and date ranges, as a single list of paramsets. 
+    Relative urls are joined together rather than overwritten, 
+    empty dimensions are ignored. """
+    dimensions = [dimension for dimension in dimensions if dimension]
+    paramsets = []
+    for combination in itertools.product(*dimensions):
+        paramset = {}
+        segments = []
+        for params in combination:
+            params = copy.copy(params)
+            if 'relative_url' in params:
+                segments.append(params.pop('relative_url'))
+            paramset.update(params)
+        if segments:
+            paramset['relative_url'] = "/".join(segments)
+        paramsets.append(paramset)
+    return paramsets
+
+
+def ttl(response, created=None):
+    """ The amount of seconds a response can be cached: 
+    long for insights that ended well before today, short 
+    for anything else. Lifetime insights have no end time, 
+    but for an object that was `created` well before today, 
+    e.g. an older post, they are just as settled. """
+    if not isinstance(response, dict):
+        return UNSETTLED_TTL
+
+    end_times = [row['end_time'] 
+        for dataset in response.get('data', []) if isinstance(dataset, dict) 
+        for row in dataset.get('values', []) if 'end_time' in row]
+
+    if end_times:
+        # end times share a single format, so the latest 
+        # one is also the last one alphabetically
+        latest = date.parse(max(end_times))
+    elif created:
+        latest = created
+    else:
+        return UNSETTLED_TTL
+
+    if not latest.tzinfo:
+        latest = pytz.utc.localize(latest)
+    now = datetime.datetime.now(pytz.utc)
+
+    if latest < now - SETTLED_AFTER:
+        return SETTLED_TTL
+    else:
+        return UNSETTLED_TTL
+
+
+class BatchPlanner(object):
+    """ Packs sub-requests into as few batch requests as the 
+    Graph API will accept, sends those batches concurrently 
+    and returns the responses in the original request order. """
+
+    def __init__(self, graph, size=BATCH_SIZE, workers=parallel.WORKERS):
+        self.graph = graph
+        self.size = size
+        self.workers = workers
+
+    def plan(self, requests):
+        return [requests[i:i + self.size] 
+            for i in range(0, len(requests), self.size)]
+
+    def _batch(self, requests):
+        # facepy encodes request bodies in place
+        return list(self.graph.batch([dict(request) for request in requests]))
+
+    def send(self, batch):
+        # a throttled sub-request should not fail the entire 
+        # batch, so we retry those, and only those, after a while
+        scheduler = self.graph.scheduler
+        start = instrument.timer()
+        responses = self._batch(batch)
+        retries = 0
+        for attempt in range(scheduler.retries):
+            throttled = [i for i, response in enumerate(responses) 
+                if ratelimit.is_throttled_error(response)]
+            if not throttled:
+                break
+            scheduler.throttled(attempt)
+            retries += len(throttled)
+            retried = self._batch([batch[i] for i in throttled])
+            for i, response in zip(throttled, retried):
+                responses[i] = response
+
+        instrument.emit(self.graph.hooks, 'batch', 
+            size=len(batch), 
+            retries=retries, 
+            seconds=instrument.timer() - start)
+        return responses
+
+    def run(self, requests):
+        batches = self.plan(list(requests))
+        responses = parallel.map(self.send, batches, self.workers)
+        return list(itertools.chain(*responses))
+
+
+class Endpoints(object):
+    """ Resolves endpoints relative to the object a client 
+    is bound to, for both the blocking and the asyncio 
+    Graph API clients. """
 
     def _segmentize_endpoint(self, endpoint):
         if not isinstance(endpoint, list):
             endpoint = [endpoint]
         return endpoint
 
-    def _resolve_endpoint(self, endpoint, options={}):
+    def _resolve_endpoint(self, endpoint, options={}, base=None):
         endpoint = self._segmentize_endpoint(endpoint)
-        resolved_url = "/".join(self.base + endpoint)
+        if base is None:
+            base = self.base
+        resolved_url = "/".join(base + endpoint)
         # remove facepy options, retain everything 
         # that needs to end up in the querystring
-        blacklist = ['path', 'page', 'retry', 'data', 'method', 'relative_url']
+        blacklist = ['path', 'page', 'retry', 'data', 'method', 'relative_url', 'object', 'created']
         if options:
-            qs = url.encode({key: value for key, value in options.items() if key not in blacklist})
-            return resolved_url + '?' + qs
-        else:
-            return resolved_url
-    
-    def partial(self, base):
-        client = GraphAPI(self.oauth_token)
-        client.base = client.base + self._segmentize_endpoint(base)
-        return client
+            # sorted, so that the same options will 
+            # always result in the same url
+            qs = url.encode(sorted([(key, value) for key, value in options.items() if key not in blacklist]))
+            if qs:
+                return resolved_url + '?' + qs
 
-    def all(self, endpoint, paramsets, method='GET', body=False, **options):
-        """ A nicer interface for batch requests to the 
-        same endpoint but with different parameters, e.g. 
-        different date ranges. """
+        return resolved_url
 
+    def _batch_requests(self, endpoint, paramsets, method='GET', body=False, options={}):
         requests = []
         for params in paramsets:
-            params = copy.copy(params)
-            params.update(options)
+            params = dict(options, **params)
             segments = self._segmentize_endpoint(endpoint)
             relative_url = params.get('relative_url')
-            resolved_url = self._resolve_endpoint(segments + [relative_url], params)
+            if relative_url:
+                segments = segments + [relative_url]
+            if 'object' in params:
+                base = self._segmentize_endpoint(params['object'])
+            else:
+                base = self.base
+            resolved_url = self._resolve_endpoint(segments, params, base)
             request = {
                 'method': method, 
                 'relative_url': resolved_url, 
@@ -61,11 +195,136 @@ class GraphAPI(facepy.GraphAPI):
 
             requests.append(request)
 
-        return self.batch(requests)
+        return requests
+
+
+class GraphAPI(Endpoints, facepy.GraphAPI):
+    """ A Graph API client with support for relative endpoints, 
+    batched requests and, if a cache (see `utils.cache`) is 
+    passed in, cached responses. How long a response is 
+    cached is up to the `ttl` function. Requests are paced 
+    and retried by a `utils.ratelimit.Scheduler`. Hooks receive 
+    timing and size events, see `utils.instrument`. """
+
+    def __init__(self, *vargs, **kwargs):
+        self.base = []
+        self.workers = kwargs.pop('workers', parallel.WORKERS)
+        self.cache = kwargs.pop('cache', None)
+        self.ttl = kwargs.pop('ttl', ttl)
+        self.scheduler = kwargs.pop('scheduler', None) or ratelimit.Scheduler()
+        # shared by reference with every partial client
+        self.hooks = list(kwargs.pop('hooks', []))
+        pool_size = kwargs.pop('pool_size', POOL_SIZE)
+        super(GraphAPI, self).__init__(*vargs, **kwargs)
+        self.session = ratelimit.ThrottledSession(self.scheduler, pool_size, self.hooks)
+
+    def with_token(self, oauth_token):
+        """ A root client for a different token that shares 
+        this client's connection pool, scheduler and cache. """
+        client = copy.copy(self)
+        client.oauth_token = oauth_token
+        client.base = []
+        return client
+
+    def partial(self, base):
+        """ A view on this client, relative to `base`, that 
+        shares its connection pool, scheduler and cache. """
+        client = copy.copy(self)
+        client.base = self.base + self._segmentize_endpoint(base)
+        return client
+
+    def subscribe(self, hook):
+        """ Send events to `hook`, for this client and 
+        every client that shares its connection pool. """
+        self.hooks.append(hook)
+        return hook
+
+    def unsubscribe(self, hook):
+        self.hooks.remove(hook)
+
+    def _cache_key(self, resolved_url):
+        # responses are specific to the token that was used, 
+        # but there's no need to store the token itself
+        token = str(self.oauth_token).encode('utf-8')
+        scope = hashlib.sha1(token).hexdigest()
+        return scope + ':' + resolved_url
+
+    def _from_cache(self, key):
+        try:
+            return self.cache.get(key)
+        except KeyError:
+            return MISSING
+
+    def _to_cache(self, key, response, created=None):
+        if response is None or isinstance(response, Exception):
+            return
+        if isinstance(response, dict):
+            response = {k: v for k, v in response.items() if k != 'headers'}
+        self.cache.set(key, response, ttl=self.ttl(response, created))
+
+    def all(self, endpoint, paramsets, method='GET', body=False, **options):
+        """ A nicer interface for batch requests to the 
+        same endpoint but with different parameters, e.g. 
+        different date ranges. Options apply to every request 
+        unless a paramset overrides them. A paramset can 
+        also point to a different `object` than the one 
+        this client is bound to. Any number of paramsets 
+        can be passed: they will be packed into as many 
+        batch requests as needed. A paramset can say when 
+        its object was `created`, which decides how long 
+        lifetime insights are cached. """
+
+        start = instrument.timer()
+        paramsets = list(paramsets)
+        event = {'endpoint': instrument.endpoint(self._resolve_endpoint(endpoint))}
+        requests = self._batch_requests(endpoint, paramsets, method, body, options)
+
+        planner = BatchPlanner(self, workers=self.workers)
+
+        if self.cache is None or method != 'GET':
+            responses = planner.run(requests)
+        else:
+            # only ask for what we don't already have
+            keys = [self._cache_key(request['relative_url']) for request in requests]
+            responses = [self._from_cache(key) for key in keys]
+            misses = [i for i, response in enumerate(responses) if response is MISSING]
+            fetched = planner.run([requests[i] for i in misses])
+            for i, response in zip(misses, fetched):
+                created = paramsets[i].get('created', options.get('created'))
+                self._to_cache(keys[i], response, created)
+                responses[i] = response
+            event['hits'] = len(requests) - len(misses)
+
+        instrument.emit(self.hooks, 'all', 
+            size=len(requests), 
+            seconds=instrument.timer() - start, 
+            **event)
+        return responses
 
     def get(self, relative_endpoint=[], *vargs, **kwargs):
         """ An endpoint can be specified as a string
          or as a list of path segments. """
 
+        start = instrument.timer()
         endpoint = self._resolve_endpoint(relative_endpoint)
-        return super(GraphAPI, self).get(endpoint, *vargs, **kwargs)
+
+        # paginated results are neither cached nor timed, 
+        # as pages are only fetched when they are consumed
+        if kwargs.get('page'):
+            return super(GraphAPI, self).get(endpoint, *vargs, **kwargs)
+
+        event = {'endpoint': instrument.endpoint(endpoint)}
+        if self.cache is None or vargs:
+            response = super(GraphAPI, self).get(endpoint, *vargs, **kwargs)
+        else:
+            key = self._cache_key(self._resolve_endpoint(relative_endpoint, kwargs))
+            response = self._from_cache(key)
+            event['cached'] = response is not MISSING
+            if response is MISSING:
+                response = super(GraphAPI, self).get(endpoint, *vargs, **kwargs)
+                self._to_cache(key, response)
+
+        instrument.emit(self.hooks, 'get', 
+            seconds=instrument.timer() - start, 
+            **event)
+        return response
@@ -0,0 +1,168 @@
+# encoding: utf-8
+
+import time
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+from collections import OrderedDict
+
+
+def encode(obj):
+    # the Graph API client parses floats as decimals
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("{} is not JSON serializable".format(repr(obj)))
+
+
+class MemoryCache(object):
+    """ An in-memory cache. Entries expire after `ttl` seconds 
+    and once there are more than `size` entries, the least 
+    recently used ones are evicted. """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expires(self, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            return None
+        else:
+            return time.time() + ttl
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.entries.pop(key)
+            if expires is not None and expires < time.time():
+                raise KeyError(key)
+            # reinserting marks the entry as most recently used
+            self.entries[key] = (value, expires)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, self._expires(ttl))
+            while self.size is not None and len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCache(MemoryCache):
+    """ A persistent cache in a local SQLite database, with 
+    the same expiry and eviction rules as `MemoryCache`. 
+    Values should be serializable to JSON. Lookups don't 
+    write to the database: when entries were last used is 
+    saved in batches of `flush_every` lookups, before any 
+    entries are evicted and on `close`. """
+
+    def __init__(self, path, size=None, ttl=None, flush_every=1000):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.flush_every = flush_every
+        # key => last access, not yet saved
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, 
+                    value TEXT, 
+                    expires REAL, 
+                    accessed REAL
+                )""")
+            self.db.execute("""
+                CREATE INDEX IF NOT EXISTS entries_accessed 
+                ON entries (accessed)""")
+        # counting rows means a full scan, so 
+        # we keep track of the count ourselves
+        self.count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", 
+                (key, )).fetchone()
+            if row is None:
+                raise KeyError(key)
+            value, expires = row
+            if expires is not None and expires < now:
+                self.accessed.pop(key, None)
+                # committed before raising, which would roll back
+                with self.db:
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (key, ))
+                self.count -= 1
+                raise KeyError(key)
+            self.accessed[key] = now
+            if len(self.accessed) >= self.flush_every:
+                with self.db:
+                    self._flush()
+
+        return json.loads(value, parse_float=Decimal)
+
+    def _flush(self):
+        if self.accessed:
+            self.db.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?", 
+                [(accessed, key) for key, accessed in self.accessed.items()])
+            self.accessed.clear()
+
+    def set(self, key, value, ttl=None):
+        with self.lock, self.db:
+            exists = self.db.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key, )).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", 
+                (key, json.dumps(value, default=encode), self._expires(ttl), time.time()))
+            self.accessed.pop(key, None)
+            if not exists:
+                self.count += 1
+            # only evict when over the bound, least recently 
+            # used first, which the index makes cheap
+            if self.size is not None and self.count > self.size:
+                self._flush()
+                evicted = self.db.execute("""
+                    DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries 
+                        ORDER BY accessed ASC 
+                        LIMIT ?
+                    )""", (self.count - self.size, )).rowcount
+                self.count -= evicted
+
+    def delete(self, key):
+        with self.lock, self.db:
+            self.accessed.pop(key, None)
+            self.count -= self.db.execute(
+                "DELETE FROM entries WHERE key = ?", (key, )).rowcount
+
+    def clear(self):
+        with self.lock, self.db:
+            self.accessed.clear()
+            self.db.execute("DELETE FROM entries")
+            self.count = 0
+
+    def close(self):
+        with self.lock:
+            with self.db:
+                self._flush()
+            self.db.close()
+
+    def __len__(self):
+        return self.count
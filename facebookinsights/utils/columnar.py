@@ -0,0 +1,82 @@
+# encoding: utf-8
+
+"""
+Columnar versions of insights results, built straight from 
+the `values` that the Graph API returns rather than from rows. 
+NumPy and pandas are optional dependencies and are only 
+imported when needed.
+"""
+
+import numbers
+
+
+# lifetime metrics have no end time
+NO_END_TIME = 'NaT'
+
+
+def _end_time(row):
+    end_time = row.get('end_time')
+    if end_time is None:
+        return NO_END_TIME
+    # the Graph API returns UTC timestamps, which NumPy 
+    # will parse if we leave off the offset
+    elif end_time.endswith('+0000'):
+        return end_time[:-5]
+    else:
+        from . import date
+        return date.parse(end_time).astimezone(date.pytz.utc).isoformat()[:19]
+
+def _is_number(value):
+    # missing values don't make a metric non-numeric, 
+    # they become NaN
+    return value is None or isinstance(value, numbers.Number)
+
+def arrays(datasets):
+    """ A dictionary of NumPy arrays, one for each metric 
+    and an `end_time` datetime64 index. Numeric metrics 
+    become float arrays, with NaN for missing days; 
+    any other metric becomes an object array. """
+    import numpy as np
+
+    end_times = set()
+    for dataset in datasets:
+        end_times.update([_end_time(row) for row in dataset['values']])
+
+    index = np.array(sorted(end_times), dtype='datetime64[s]')
+    columns = {'end_time': index}
+
+    for dataset in datasets:
+        metric = dataset['name']
+        rows = dataset['values']
+        values = [row['value'] for row in rows]
+        positions = np.searchsorted(index, 
+            np.array([_end_time(row) for row in rows], dtype='datetime64[s]'))
+
+        if metric not in columns:
+            if all(_is_number(value) for value in values):
+                column = np.full(len(index), np.nan)
+            else:
+                column = np.empty(len(index), dtype=object)
+            columns[metric] = column
+        column = columns[metric]
+
+        # a metric can turn out to be non-numeric in a later chunk
+        if column.dtype != object and not all(_is_number(value) for value in values):
+            column = columns[metric] = column.astype(object)
+
+        if column.dtype == object:
+            column[positions] = values
+        else:
+            column[positions] = np.array(values, dtype=float)
+
+    return columns
+
+def frame(datasets):
+    """ A pandas DataFrame with a column for each metric, 
+    indexed by end time (in UTC). """
+    import pandas as pd
+
+    columns = arrays(datasets)
+    index = pd.DatetimeIndex(columns.pop('end_time'), name='end_time')
+    index = index.tz_localize('UTC')
+    return pd.DataFrame(columns, index=index)
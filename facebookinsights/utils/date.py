@@ -1,5 +1,6 @@
 # encoding: utf-8
 
+import re
 import time
 import datetime as builtin_datetime
 import pytz
@@ -17,8 +18,31 @@ except NameError:
 UTC = COMMON_ERA = builtin_datetime.datetime(1, 1, 1, tzinfo=pytz.utc).date()
 
 
+# the Graph API always formats its timestamps
+# the same way, e.g. 2014-08-19T07:00:00+0000
+GRAPH_TIMESTAMP = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)([+-])(\d\d):?(\d\d)$')
+
+
+def _parse_graph_timestamp(match):
+    year, month, day, hour, minute, second, sign, tz_hours, tz_minutes = match.groups()
+    offset = int(tz_hours) * 60 + int(tz_minutes)
+    if offset:
+        if sign == '-':
+            offset = -offset
+        tz = pytz.FixedOffset(offset)
+    else:
+        tz = pytz.utc
+    return builtin_datetime.datetime(int(year), int(month), int(day), 
+        int(hour), int(minute), int(second), tzinfo=tz)
+
 def parse(datestring, utc=False):
-    if utc:
+    # a fast path for Graph API timestamps, 
+    # dateutil for anything else
+    match = GRAPH_TIMESTAMP.match(datestring)
+    if match:
+        return _parse_graph_timestamp(match)
+    elif utc:
         return parser.parse(datestring, default=UTC)
     else:
         return parser.parse(datestring)
@@ -0,0 +1,162 @@
+# encoding: utf-8
+
+"""
+Sinks that write serialized rows to a file or to stdout as they
+come in, rather than building them all up in memory first.
+
+    with export.CSV('insights.csv.gz') as sink:
+        page.insights.daily(metrics).range(days=365).export(sink, flat=True)
+"""
+
+import io
+import sys
+import csv
+import gzip
+import json
+from collections import OrderedDict
+
+from .cache import encode
+from .flat import Flattener
+
+# Python 2 and 3 compatibility
+PY2 = sys.version_info[0] < 3
+
+
+def _open(path, compress):
+    if PY2:
+        mode = 'wb'
+        if compress:
+            return gzip.open(path, mode)
+        else:
+            return open(path, mode)
+    elif compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    else:
+        return io.open(path, 'w', encoding='utf-8', newline='')
+
+def schema(tables, flat=False, skip=(), connector='_'):
+    """ Columns for a number of `utils.rows.Table` objects:
+    the end time, then every metric or, for flattened rows,
+    every key of every metric in any of the rows, so that
+    keys which only show up partway through a date range
+    still get a column. """
+    flatten = Flattener(connector, skip)
+    fields = ['end_time']
+    for table in tables:
+        for field in table.fields[1:]:
+            if flat and field not in skip:
+                keys = set()
+                for value in table.column(field):
+                    if isinstance(value, dict):
+                        keys.update(flatten({field: value}))
+                    else:
+                        keys.add(field)
+                keys = sorted(keys)
+            else:
+                keys = [field]
+            fields.extend(key for key in keys if key not in fields)
+    return fields
+
+
+class Sink(object):
+    """ Writes to `destination`, which can be a file handle,
+    a path or `-` for stdout. Paths that end in `.gz` are
+    compressed unless `compress` says otherwise. """
+
+    def __init__(self, destination='-', compress=None):
+        if destination == '-':
+            self.stream = sys.stdout
+            self.owned = False
+        elif hasattr(destination, 'write'):
+            self.stream = destination
+            self.owned = False
+        else:
+            if compress is None:
+                compress = destination.endswith('.gz')
+            self.stream = _open(destination, compress)
+            self.owned = True
+        self.rows = 0
+
+    def begin(self, fields):
+        """ Called with the columns for the rows that follow. """
+        pass
+
+    def write(self, row):
+        raise NotImplementedError()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NDJSON(Sink):
+    """ One JSON object per line. """
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, default=encode))
+        self.stream.write('\n')
+        self.rows += 1
+
+
+class CSV(Sink):
+    """ Comma-separated values, with a header taken from the
+    first schema it's given or from `fields`. Columns stay
+    the same for the entire file: missing values are left
+    empty, but the header can't be rewritten once it's out,
+    so rows or schemas with other columns raise a ValueError
+    rather than losing data. When writing rows for more than
+    one schema, pass in all of their columns as `fields`.
+    Nested values that were not flattened become JSON. """
+
+    def __init__(self, destination='-', compress=None, fields=None):
+        super(CSV, self).__init__(destination, compress)
+        self.fields = fields
+        self.writer = None
+
+    def begin(self, fields):
+        if self.writer is None:
+            self.fields = self.fields or fields
+            self.writer = csv.DictWriter(self.stream, self.fields,
+                restval='', extrasaction='raise')
+            self.writer.writeheader()
+        else:
+            unknown = [field for field in fields if field not in self.writer.fieldnames]
+            if unknown:
+                raise ValueError("No column for {} in a CSV header that was already written.".format(
+                    ", ".join(unknown)))
+
+    def _format(self, value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=encode)
+        else:
+            return value
+
+    def write(self, row):
+        if self.writer is None:
+            self.begin(list(row.keys()))
+        self.writer.writerow(dict((key, self._format(value))
+            for key, value in row.items()))
+        self.rows += 1
+
+
+class Tagged(object):
+    """ Adds the same fields, e.g. the page a row is 
+    for, to the front of every row written to `sink`. """
+
+    def __init__(self, sink, **tags):
+        self.sink = sink
+        self.tags = sorted(tags.items())
+
+    def begin(self, fields):
+        self.sink.begin([key for key, value in self.tags] + list(fields))
+
+    def write(self, row):
+        self.sink.write(OrderedDict(self.tags + list(row.items())))
@@ -0,0 +1,61 @@
+# encoding: utf-8
+
+"""
+Quotes and links in the text of posts, for a single post or
+for many posts at once, with an index of which posts share
+which links.
+"""
+
+from __future__ import unicode_literals
+
+import re
+from collections import namedtuple, OrderedDict
+
+
+# quotes end at the end of a line, which is also
+# where the message of a post ends and its description
+# begins, so whitespace around a quote can't be a newline
+QUOTE_PATTERN = re.compile(r'[\"“„«][^\S\n]?(.+?)[^\S\n]?[\"“”»]')
+# links end at whitespace or at anything that can't be part
+# of a url, so newlines, brackets and quotes don't get in the way
+LINK_PATTERN = re.compile(r'https?://[^\s<>\[\]{}\"“”„«»]+')
+# punctuation right after a link is usually part of the sentence
+TRAILING = '.,;:!?\''
+
+Extracts = namedtuple('Extracts', ['quotes', 'links', 'index'])
+
+
+def _clean(link):
+    while True:
+        link = link.rstrip(TRAILING)
+        # a closing bracket that isn't part of the link itself
+        if link.endswith(')') and link.count('(') < link.count(')'):
+            link = link[:-1]
+        else:
+            return link
+
+def quotes(text):
+    return QUOTE_PATTERN.findall(text)
+
+def links(text):
+    return [_clean(link) for link in LINK_PATTERN.findall(text)]
+
+def bulk(documents):
+    """ Quotes and links for any number of `(key, text)`
+    documents, by key, in a single pass. """
+    _quotes = OrderedDict()
+    _links = OrderedDict()
+    findquotes = QUOTE_PATTERN.findall
+    findlinks = LINK_PATTERN.findall
+    for key, text in documents:
+        _quotes[key] = findquotes(text)
+        _links[key] = set([_clean(link) for link in findlinks(text)])
+    return _quotes, _links
+
+def index(links):
+    """ Keys by link, for sets or lists of links by key. """
+    keys = {}
+    for key, _links in links.items():
+        for link in _links:
+            keys.setdefault(link, []).append(key)
+    return keys
@@ -0,0 +1,57 @@
+# encoding: utf-8
+
+"""
+Flattening for rows that all share more or less the same
+shape, like the rows of breakdown metrics such as
+`page_fans_gender_age`, which can have hundreds of keys.
+"""
+
+
+class Flattener(object):
+    """ Flattens nested dictionaries the same way
+    `utils.flatten` does, e.g.
+
+        {'fans': {'US': 5, 'BE': 1}} => {'fans_US': 5, 'fans_BE': 1}
+
+    but in a single pass, into a single dictionary, and
+    with a schema of flattened keys for every parent key
+    that is compiled the first time a key comes up and then
+    reused for every other row. Keys that only show up
+    partway through a range are simply added to the schema
+    when they do. """
+
+    def __init__(self, connector='_', skip=()):
+        self.connector = connector
+        self.skip = skip
+        # parent key => key => (flattened key, whether to expand)
+        self.schemas = {}
+
+    def _compile(self, schema, parent, key):
+        if parent:
+            name = parent + self.connector + key
+        else:
+            name = key
+        schema[key] = compiled = (name, name not in self.skip)
+        return compiled
+
+    def _flatten(self, flat, d, parent):
+        schema = self.schemas.get(parent)
+        if schema is None:
+            schema = self.schemas[parent] = {}
+
+        for key, value in d.items():
+            compiled = schema.get(key)
+            if compiled is None:
+                compiled = self._compile(schema, parent, key)
+            name, expand = compiled
+            if expand and isinstance(value, dict):
+                self._flatten(flat, value, name)
+            else:
+                flat[name] = value
+
+    def flatten(self, d, parent_key=''):
+        flat = {}
+        self._flatten(flat, d, parent_key)
+        return flat
+
+    __call__ = flatten
@@ -1,19 +1,133 @@
 # encoding: utf-8
 
 import functools
+import threading
 
+from .cache import MemoryCache
 
-class memoize:
-  def __init__(self, function):
-    self.function = function
-    self.memoized = {}
 
-  def __call__(self, *args):
-    try:
-        return self.memoized[args]
-    except KeyError:
-        self.memoized[args] = self.function(*args)
-        return self.memoized[args]
+# separates positional from keyword arguments in keys
+MISSING = object()
+
+
+class memoize(object):
+    """ Remembers what a function returned for the same 
+    positional and keyword arguments, either as `@memoize` 
+    or with options, as `@memoize(size=1000, ttl=60)`: no 
+    more than `size` results are kept, least recently used 
+    first to go, and results expire after `ttl` seconds. 
+    On methods, every instance gets results of its own, 
+    kept on the instance, unless a `key` function, which 
+    gets the same arguments as the method, says which 
+    instances can share results. Arguments that can't be 
+    hashed are never cached. """
+
+    def __init__(self, function=None, size=None, ttl=None, key=None):
+        self.size = size
+        self.ttl = ttl
+        self.key = key
+        self.memoized = MemoryCache(size, ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.function = None
+        if function is not None:
+            self._wrap(function)
+
+    def _wrap(self, function):
+        self.function = function
+        self.slot = '_memoized_' + function.__name__
+        functools.update_wrapper(self, function)
+        return self
+
+    def _key(self, args, kwargs):
+        if self.key is not None:
+            return self.key(*args, **kwargs)
+        elif kwargs:
+            return args + (MISSING, ) + tuple(sorted(kwargs.items()))
+        else:
+            return args
+
+    def _call(self, memoized, key, args, kwargs):
+        try:
+            value = memoized.get(key)
+        except KeyError:
+            pass
+        except TypeError:
+            return self.function(*args, **kwargs)
+        else:
+            with self.lock:
+                self.hits += 1
+            return value
+
+        value = self.function(*args, **kwargs)
+        memoized.set(key, value)
+        with self.lock:
+            self.misses += 1
+        return value
+
+    def __call__(self, *args, **kwargs):
+        # `@memoize(...)` is called with the 
+        # function itself, once options are set
+        if self.function is None:
+            return self._wrap(*args)
+
+        return self._call(self.memoized, self._key(args, kwargs), args, kwargs)
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        # results are shared by key, which 
+        # doesn't hold on to the instance
+        if self.key is not None:
+            return functools.partial(self, obj)
+
+        # results go when the instance goes
+        memoized = obj.__dict__.get(self.slot)
+        if memoized is None:
+            memoized = obj.__dict__.setdefault(self.slot, MemoryCache(self.size, self.ttl))
+
+        def method(*args, **kwargs):
+            return self._call(memoized, self._key(args, kwargs), (obj, ) + args, kwargs)
+        return functools.update_wrapper(method, self.function)
+
+    def clear(self):
+        """ Forget shared results. Results kept 
+        on instances go with the instance. """
+        self.memoized.clear()
+        with self.lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits, 
+                'misses': self.misses, 
+                'size': len(self.memoized), 
+                }
+
+
+class lazy(object):
+    """ A property that is computed on first access and then 
+    remembered. The value is stored under the name of the 
+    property prefixed with an underscore, so this works for 
+    classes with `__slots__` too, as long as they have a 
+    slot by that name. """
+
+    def __init__(self, function):
+        self.function = function
+        self.slot = '_' + function.__name__
+        functools.update_wrapper(self, function)
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.function(obj)
+            setattr(obj, self.slot, value)
+            return value
 
 
 def immutable(method):
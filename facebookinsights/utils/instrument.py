@@ -0,0 +1,151 @@
+# encoding: utf-8
+
+"""
+Hooks that receive an event for everything the Graph API client
+and selections do, e.g.
+
+    {'type': 'request', 'method': 'GET', 'endpoint': '/{id}/posts',
+     'status': 200, 'bytes': 51234, 'seconds': 0.31, 'retries': 0}
+
+Events are plain dictionaries with a `type`, which is one of
+
+* `request`: a single HTTP request
+* `batch`: a batch request with `size` sub-requests
+* `get` and `all`: calls to those `GraphAPI` methods, including
+  `cached` and `hits` when a response cache is used
+* `select`: a selection that was fetched, with `items` and
+  separate `fetch` and `parse` times where these are known
+
+Any callable can be a hook. `Stats` aggregates events into
+totals and `Log` passes them on to Python logging.
+"""
+
+import re
+import logging
+import threading
+from timeit import default_timer as timer
+
+
+logger = logging.getLogger('facebookinsights')
+
+# object ids would make for as many endpoints as there are objects
+OBJECT_ID = re.compile(r'(?<=/)\d+(_\d+)?(?=/|$)')
+
+
+def endpoint(path):
+    """ A path without hostname, querystring or version
+    and with object ids replaced by `{id}`. """
+    path = re.sub(r'^https?://[^/]+', '', path).split('?')[0]
+    path = re.sub(r'^/v\d+\.\d+', '', path)
+    if not path.startswith('/'):
+        path = '/' + path
+    return OBJECT_ID.sub('{id}', path)
+
+def timed(iterable, clock):
+    """ Iterates over `iterable`, adding the time spent 
+    waiting on each item to `clock['seconds']`. """
+    iterator = iter(iterable)
+    while True:
+        start = timer()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            clock['seconds'] = clock.get('seconds', 0) + timer() - start
+        yield item
+
+def emit(hooks, type, **fields):
+    if not hooks:
+        return
+    fields['type'] = type
+    for hook in hooks:
+        # instrumentation should never break a request
+        try:
+            hook(fields)
+        except Exception:
+            logger.exception("Instrumentation hook {} failed.".format(hook))
+
+
+class Stats(object):
+    """ Aggregates events into totals: HTTP requests, batches,
+    bytes downloaded, retries, cache hits and misses, time
+    spent parsing and latency by endpoint. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.batches = 0
+        self.subrequests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.hits = 0
+        self.misses = 0
+        self.fetch_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.endpoints = {}
+
+    def __call__(self, event):
+        with self.lock:
+            kind = event['type']
+            if kind == 'request':
+                self.requests += 1
+                self.bytes += event.get('bytes', 0)
+                self.retries += event.get('retries', 0)
+                latency = self.endpoints.setdefault(event['endpoint'],
+                    {'count': 0, 'seconds': 0.0, 'max': 0.0})
+                latency['count'] += 1
+                latency['seconds'] += event['seconds']
+                latency['max'] = max(latency['max'], event['seconds'])
+            elif kind == 'batch':
+                self.batches += 1
+                self.subrequests += event['size']
+                self.retries += event.get('retries', 0)
+            elif kind == 'get' and 'cached' in event:
+                if event['cached']:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            elif kind == 'all' and 'hits' in event:
+                self.hits += event['hits']
+                self.misses += event['size'] - event['hits']
+            elif kind == 'select':
+                self.fetch_seconds += event.get('fetch', 0)
+                self.parse_seconds += event.get('parse', 0)
+
+    def summary(self):
+        with self.lock:
+            endpoints = dict((name, dict(latency, mean=latency['seconds'] / latency['count']))
+                for name, latency in self.endpoints.items())
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'subrequests': self.subrequests,
+                'bytes': self.bytes,
+                'retries': self.retries,
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'fetch_seconds': self.fetch_seconds,
+                'parse_seconds': self.parse_seconds,
+                'endpoints': endpoints,
+                }
+
+    def __repr__(self):
+        return u"<Stats: {} requests ({} batches), {} bytes, {} retries>".format(
+            self.requests, self.batches, self.bytes, self.retries)
+
+
+class Log(object):
+    """ Logs every event, at debug level by default. """
+
+    def __init__(self, logger=logger, level=logging.DEBUG):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, event):
+        details = ", ".join("{}={}".format(key, value)
+            for key, value in sorted(event.items()) if key != 'type')
+        self.logger.log(self.level, "%s: %s", event['type'], details)
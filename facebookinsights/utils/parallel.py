@@ -0,0 +1,97 @@
+# encoding: utf-8
+
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    # Python 2
+    import Queue as queue
+except ImportError:
+    # Python 3
+    import queue
+
+
+# most of what we do concurrently is waiting on the network, 
+# so threads work fine and keep us compatible with Python 2
+WORKERS = 8
+
+
+def map(function, iterable, workers=WORKERS):
+    """ Like the builtin `map` but runs `function` in a pool 
+    of threads. Results are returned in the same order as 
+    the input, and any exception is re-raised. """
+    items = list(iterable)
+
+    if workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def as_completed(function, iterable, workers=WORKERS):
+    """ Like `map`, but yields results as soon as they 
+    come in, in whatever order that happens to be. """
+    items = list(iterable)
+
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        for result in pool.imap_unordered(function, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def prefetch(iterable, depth=1):
+    """ Iterate over `iterable` in a background thread, 
+    fetching up to `depth` items ahead of the consumer, 
+    e.g. the next page of results while the current one 
+    is being processed. """
+    slots = threading.Semaphore(depth)
+    results = queue.Queue()
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            iterator = iter(iterable)
+            while True:
+                # wait for the consumer to catch up
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    results.put((done, None))
+                    return
+                results.put((item, None))
+        except Exception as exception:
+            results.put((done, exception))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, exception = results.get()
+            if exception is not None:
+                raise exception
+            if item is done:
+                return
+            slots.release()
+            yield item
+    finally:
+        # wake up the producer so it can stop
+        stopped.set()
+        slots.release()
@@ -0,0 +1,217 @@
+# encoding: utf-8
+
+import json
+import time
+import random
+import threading
+import requests
+import facepy
+
+from . import instrument
+from .url import parse
+
+
+# the Graph API reports how much of each rate limit
+# has been used up, as a percentage, in these headers
+USAGE_HEADERS = (
+    'x-app-usage',
+    'x-page-usage',
+    'x-ad-account-usage',
+    'x-business-use-case-usage',
+    )
+# whereas the others are specific to a page, ad 
+# account or business, and thus to a token
+APP_HEADERS = ('x-app-usage', )
+
+# error codes for application, user, page and
+# business use case rate limits
+THROTTLE_CODES = set([4, 17, 32, 613] + list(range(80000, 80015)))
+
+
+def _percentages(usage):
+    """ All percentages in a usage header, which can be
+    a dictionary or, for business use cases, a dictionary
+    of lists of dictionaries. """
+    if isinstance(usage, dict):
+        for key, value in usage.items():
+            if isinstance(value, (int, float)) and key != 'estimated_time_to_regain_access':
+                yield value
+            else:
+                for percentage in _percentages(value):
+                    yield percentage
+    elif isinstance(usage, list):
+        for item in usage:
+            for percentage in _percentages(item):
+                yield percentage
+
+def _regain_access(usage):
+    """ Minutes until we can make calls again, if
+    Facebook tells us so. """
+    if isinstance(usage, dict):
+        minutes = [usage.get('estimated_time_to_regain_access', 0)]
+        minutes.extend([_regain_access(value) for value in usage.values()
+            if isinstance(value, (dict, list))])
+        return max(minutes)
+    elif isinstance(usage, list):
+        return max([_regain_access(item) for item in usage] or [0])
+    else:
+        return 0
+
+def _token(url, options):
+    """ The access token of a request, which is either 
+    in its parameters or, for the next page of results, 
+    in its url. """
+    for key in ('params', 'data'):
+        params = options.get(key)
+        if isinstance(params, dict) and params.get('access_token'):
+            return params['access_token']
+    return dict(parse.parse_qsl(parse.urlparse(url).query)).get('access_token')
+
+def is_throttled_error(error):
+    return isinstance(error, facepy.FacebookError) and error.code in THROTTLE_CODES
+
+def is_throttled(status_code, body):
+    if status_code == 429:
+        return True
+    elif status_code < 400:
+        return False
+
+    try:
+        error = json.loads(body).get('error', {})
+    except (ValueError, AttributeError):
+        return False
+    return error.get('code') in THROTTLE_CODES
+
+
+class Scheduler(object):
+    """ Paces requests to stay within our rate limits. Requests
+    are spaced out more and more as the usage reported by the
+    Graph API passes `threshold` percent, and throttled requests
+    are retried with jittered exponential backoff. A single
+    scheduler is shared by a client and all of its partials,
+    as well as clients for other tokens made with `with_token`, 
+    so they all draw from the same budget. Application usage 
+    paces every request, whereas page and business usage only 
+    paces requests made with the token it was reported for. 
+    Requests are admitted one after the other, however many 
+    threads are making them, and a throttled request holds 
+    up every request until it is retried. """
+
+    def __init__(self, threshold=75, max_delay=10, retries=5, backoff=1, max_backoff=300):
+        self.threshold = threshold
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # (header, token) => percentage, where 
+        # the token is `None` for application usage
+        self.usage = {}
+        self.paused_until = 0
+        # token => when the next request can go out, 
+        # and `None` for requests with any token
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def update(self, headers, token=None):
+        usages = {}
+        for name in USAGE_HEADERS:
+            value = headers.get(name)
+            if value:
+                try:
+                    usages[name] = json.loads(value)
+                except ValueError:
+                    pass
+
+        if not usages:
+            return
+
+        minutes = max(_regain_access(usage) for usage in usages.values())
+        with self.lock:
+            for name, usage in usages.items():
+                scope = None if name in APP_HEADERS else token
+                self.usage[(name, scope)] = max([0] + list(_percentages(usage)))
+            if minutes:
+                self.paused_until = max(self.paused_until, time.time() + minutes * 60)
+
+    def _usage(self, token):
+        return max([0] + [usage for (name, scope), usage 
+            in self.usage.items() if scope == token])
+
+    def _paced(self, usage):
+        if usage <= self.threshold:
+            return 0
+        else:
+            headroom = 100 - self.threshold
+            return self.max_delay * min(1, float(usage - self.threshold) / headroom)
+
+    def reserve(self, token=None):
+        """ Claim the next slot for a request, and return how 
+        long to wait for it, in seconds. Every request moves 
+        the next slot forward by the current delay, so that 
+        concurrent requests queue up behind each other rather 
+        than all waiting out the same delay at once. """
+        with self.lock:
+            now = time.time()
+            shared = max(now, self.next_allowed.get(None, 0))
+            admitted = max(shared, self.next_allowed.get(token, 0), self.paused_until)
+            self.next_allowed[None] = shared + self._paced(self._usage(None))
+            if token is not None:
+                self.next_allowed[token] = admitted + self._paced(self._usage(token))
+        return admitted - now
+
+    def wait(self, token=None):
+        delay = self.reserve(token)
+        if delay:
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt):
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(ceiling / 2.0, ceiling)
+
+    def throttled(self, attempt):
+        """ Pause all requests after a throttled request, 
+        which is then retried whenever the pause is over. """
+        delay = self.backoff_delay(attempt)
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + delay)
+        return delay
+
+
+class ThrottledSession(requests.Session):
+    """ A keep-alive session that asks the scheduler before
+    making any request, keeps it informed of our usage and
+    retries requests that were throttled. Every response is 
+    reported to `listeners`, see `utils.instrument`. """
+
+    def __init__(self, scheduler, pool_size=10, listeners=None):
+        super(ThrottledSession, self).__init__()
+        self.scheduler = scheduler
+        # `hooks` is already taken by requests
+        self.listeners = listeners if listeners is not None else []
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        token = _token(url, kwargs)
+        attempt = 0
+        while True:
+            self.scheduler.wait(token)
+            start = instrument.timer()
+            response = super(ThrottledSession, self).request(method, url, **kwargs)
+            seconds = instrument.timer() - start
+            self.scheduler.update(response.headers, token)
+            throttled = is_throttled(response.status_code, response.text)
+            if attempt < self.scheduler.retries and throttled:
+                self.scheduler.throttled(attempt)
+                attempt += 1
+            else:
+                instrument.emit(self.listeners, 'request', 
+                    method=response.request.method, 
+                    endpoint=instrument.endpoint(response.url), 
+                    status=response.status_code, 
+                    bytes=len(response.content), 
+                    seconds=seconds, 
+                    retries=attempt)
+                return response
@@ -0,0 +1,77 @@
+# encoding: utf-8
+
+from collections import namedtuple
+from . import date
+from .functional import memoize
+
+
+@memoize(size=1000)
+def row_type(fields):
+    """ Row types are only created once for any set of fields. """
+    return namedtuple('Row', fields)
+
+
+class Table(object):
+    """ A compact alternative to a list of rows that stores 
+    one list per field instead of one object per row. 
+    Rows are only created when accessed. """
+
+    def __init__(self, fields, columns):
+        self.fields = fields
+        self.columns = columns
+        self.Row = row_type(fields)
+
+    def column(self, field):
+        return self.columns[self.fields.index(field)]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.Row(*values) for values in zip(*[column[key] for column in self.columns])]
+        else:
+            return self.Row(*[column[key] for column in self.columns])
+
+    def __iter__(self):
+        for values in zip(*self.columns):
+            yield self.Row(*values)
+
+    def __repr__(self):
+        return u"<Table ({} rows of {})>".format(len(self), ", ".join(self.fields))
+
+
+def build(datasets, compact=False):
+    """ Turn insights datasets into rows with an end time and 
+    a value for every metric, ordered by end time. Rows are 
+    filled in a single pass over the values of each dataset, 
+    and each end time is only parsed once. """
+    metrics = sorted(set([dataset['name'] for dataset in datasets]))
+    fields = tuple(['end_time'] + metrics)
+    positions = dict(zip(fields, range(len(fields))))
+    width = len(fields)
+
+    data = {}
+    for dataset in datasets:
+        position = positions[dataset['name']]
+        for row in dataset['values']:
+            # lifetime metrics have no end time
+            key = row.get('end_time', '')
+            values = data.get(key)
+            if values is None:
+                values = data[key] = [None] * width
+            values[position] = row['value']
+
+    # the Graph API always uses the same format for its 
+    # timestamps, so they sort chronologically as strings
+    keys = sorted(data)
+    for key in keys:
+        data[key][0] = date.parse(key) if key else 'lifetime'
+
+    if compact:
+        columns = [list(column) for column in zip(*[data[key] for key in keys])] \
+            or [[] for field in fields]
+        return Table(fields, columns)
+    else:
+        Row = row_type(fields)
+        return [Row(*data[key]) for key in keys]
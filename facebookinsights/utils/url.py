@@ -1,5 +1,7 @@
 # encoding: utf-8
 
+import threading
+import collections
 import requests
 try:
     # Python 2
@@ -10,11 +12,147 @@ except ImportError:
     import urllib.parse as parse
     from urllib.parse import urlencode as encode
 
+from . import cache as caching
+from . import parallel
+
+
+POOL_SIZE = parallel.WORKERS
+# be polite to link shorteners, which will see 
+# many requests from us in a short time otherwise
+HOST_CONCURRENCY = 4
+# the redirects of link shorteners hardly ever change, 
+# but dead links are given another chance sooner
+CACHE_TTL = 60 * 60 * 24 * 30
+CACHE_NEGATIVE_TTL = 60 * 60 * 24
+CACHE_SIZE = 100000
+# links that lead nowhere, as opposed to links to sites 
+# that just won't answer a HEAD request
+DEAD_STATUSES = (404, 410)
+
+# links are only cached after calling `enable_cache`
+_cache = None
+
+_session = None
+_session_lock = threading.Lock()
+
+def session(pool_size=POOL_SIZE):
+    """ A keep-alive session with a connection pool 
+    large enough to be shared between threads. """
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+def shared_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = session()
+    return _session
+
+
+def enable_cache(path, ttl=CACHE_TTL, size=CACHE_SIZE):
+    """ Remember resolved links in a SQLite database at `path`, 
+    for `ttl` seconds and up to `size` links. """
+    global _cache
+    _cache = caching.SQLiteCache(path, size=size, ttl=ttl)
+    return _cache
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+class DeadLinkError(requests.RequestException):
+    pass
+
+
+class Resolver(object):
+    """ Resolves many links concurrently over a shared 
+    connection pool, never opening more than `per_host` 
+    connections to any one host at a time and resolving 
+    each unique link only once. Resolved links are looked 
+    up in and saved to the link cache, if enabled. """
+
+    def __init__(self, workers=parallel.WORKERS, per_host=HOST_CONCURRENCY, 
+            session=None, cache=None, negative_ttl=CACHE_NEGATIVE_TTL):
+        self.workers = workers
+        self.per_host = per_host
+        self.session = session or shared_session()
+        if cache is None:
+            cache = _cache
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def semaphore(self, url):
+        host = parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+    def resolve(self, url):
+        if self.cache is not None:
+            try:
+                location = self.cache.get(url)
+            except KeyError:
+                pass
+            else:
+                if location is None:
+                    raise DeadLinkError("Could not resolve {}".format(url))
+                return location
+
+        try:
+            with self.semaphore(url):
+                response = self.session.head(url, allow_redirects=True)
+        except requests.Timeout:
+            # worth another try, so not remembered
+            raise
+        except requests.ConnectionError:
+            self._dead(url)
+            raise
+
+        if response.status_code in DEAD_STATUSES:
+            self._dead(url)
+            raise DeadLinkError("Could not resolve {}: {} {}".format(
+                url, response.status_code, response.reason), response=response)
+
+        if self.cache is not None:
+            self.cache.set(url, response.url)
+
+        return response.url
+
+    def _dead(self, url):
+        if self.cache is not None:
+            self.cache.set(url, None, ttl=self.negative_ttl)
+
+    def _resolve_or_keep(self, url):
+        # a single dead link should not sink a bulk 
+        # resolve, so we keep the link as-is instead
+        try:
+            return self.resolve(url)
+        except requests.RequestException:
+            return url
+
+    def resolve_all(self, urls):
+        """ Returns a dictionary that maps each link to 
+        its resolved location. """
+        unique = list(collections.OrderedDict.fromkeys(urls))
+        resolved = parallel.map(self._resolve_or_keep, unique, self.workers)
+        return dict(zip(unique, resolved))
+
+
 def resolve(url):
-    response = requests.head(url, allow_redirects=True)
-    return response.url
+    return Resolver().resolve(url)
+
+def resolve_all(urls, **options):
+    return Resolver(**options).resolve_all(urls)
 
 def base(url):
     base = parse.urlsplit(url)[:3]
     url = parse.urlunsplit(base + ('', ''))
-    return url
\ No newline at end of file
+    return url
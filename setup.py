@@ -14,7 +14,7 @@ setup(name='facebookinsights',
     keywords='data analytics api wrapper facebook insights',
     entry_points = {
           'console_scripts': [
-                'insights = insights.commands:main', 
+                'insights = facebookinsights.commands:main', 
           ],
     }, 
     install_requires=[
@@ -28,6 +28,11 @@ setup(name='facebookinsights',
         'flask', 
         'keyring', 
     ], 
+    extras_require={
+        'numpy': ['numpy'], 
+        'pandas': ['numpy', 'pandas'], 
+        'async': ['aiohttp'], 
+    }, 
     # test_suite='facebookinsights.tests', 
     classifiers=[
         'Development Status :: 3 - Alpha',